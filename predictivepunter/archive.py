@@ -0,0 +1,199 @@
+from datetime import datetime
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+import zlib
+
+import requests
+
+
+class ArchiveMissError(LookupError):
+	"""Raised in replay mode when a requested URL is not in the archive"""
+
+	pass
+
+
+class ArchivedResponse:
+	"""A minimal stand-in for a requests Response served from the archive"""
+
+	def __init__(self, url, status_code, content, encoding):
+		"""Initialize instance dependencies"""
+
+		self.url = url
+		self.status_code = status_code
+		self.content = content
+		self.encoding = encoding
+
+	@property
+	def ok(self):
+		"""Determine whether the archived response was successful"""
+
+		return self.status_code < 400
+
+	@property
+	def text(self):
+		"""Return the content of the archived response decoded as a string"""
+
+		return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+	def raise_for_status(self):
+		"""Raise an HTTPError if the archived response was unsuccessful"""
+
+		if not self.ok:
+			raise requests.HTTPError('{status_code} error for {url}'.format(status_code=self.status_code, url=self.url), response=self)
+
+
+class ResponseArchive:
+	"""Store HTTP responses in a local, content-addressed, compressed archive
+
+	Responses for pages that can no longer change, i.e. the pages of meets and races on past dates registered via add_permanent_url and pages whose URL paths contain a past date, are kept indefinitely, while all other responses (including horse, jockey and trainer profiles) expire after the specified number of seconds. If a size limit (in bytes) is specified, the least recently used responses are evicted once the archive exceeds it. In replay mode, responses are served only from the archive and missing URLs raise an ArchiveMissError.
+	"""
+
+	DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+	def __init__(self, directory, session=None, expiry=600, size_limit=0, replay=False):
+		"""Initialize instance dependencies"""
+
+		self.directory = directory
+		self.session = session
+		self.expiry = expiry
+		self.size_limit = size_limit
+		self.replay = replay
+
+		self.permanent_urls = set()
+
+		os.makedirs(os.path.join(self.directory, 'objects'), exist_ok=True)
+
+		self.lock = threading.RLock()
+		self.connection = sqlite3.connect(os.path.join(self.directory, 'index.sqlite'), check_same_thread=False)
+		with self.lock, self.connection:
+			self.connection.execute('CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, digest TEXT NOT NULL, status_code INTEGER NOT NULL, encoding TEXT, size INTEGER NOT NULL, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL, permanent INTEGER NOT NULL)')
+			self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+			self.connection.execute('CREATE INDEX IF NOT EXISTS responses_digest ON responses (digest)')
+			self.total_size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM responses)').fetchone()[0]
+
+	def __getattr__(self, name):
+
+		return getattr(self.session, name)
+
+	def add_permanent_url(self, url):
+		"""Keep the response for the specified URL indefinitely once it has been fetched"""
+
+		with self.lock:
+			self.permanent_urls.add(url)
+
+	def evict(self):
+		"""Remove the least recently used responses until the archive is within its size limit"""
+
+		if self.size_limit > 0:
+			with self.lock, self.connection:
+				while self.total_size > self.size_limit:
+					rows = self.connection.execute('SELECT url, digest FROM responses ORDER BY accessed_at LIMIT 100').fetchall()
+					if len(rows) < 1:
+						break
+					for url, digest in rows:
+						self.connection.execute('DELETE FROM responses WHERE url = ?', (url,))
+						self.remove_unreferenced(digest)
+						if self.total_size <= self.size_limit:
+							break
+
+	def remove_unreferenced(self, digest):
+		"""Remove the compressed content with the specified digest if no archived response refers to it"""
+
+		if self.connection.execute('SELECT COUNT(*) FROM responses WHERE digest = ?', (digest,)).fetchone()[0] < 1:
+			path = self.get_object_path(digest)
+			try:
+				size = os.path.getsize(path)
+				os.remove(path)
+				self.total_size -= size
+			except OSError:
+				pass
+
+	def get(self, url, *args, **kwargs):
+		"""Return the archived response for the specified URL if it has not expired, otherwise fetch and archive it via the wrapped session"""
+
+		response = self.load(url)
+		if response is not None:
+			return response
+
+		if self.replay or self.session is None:
+			raise ArchiveMissError(url)
+
+		response = self.session.get(url, *args, **kwargs)
+		if response.status_code == 200:
+			self.store(url, response)
+		return response
+
+	def get_object_path(self, digest):
+		"""Return the path to the compressed content with the specified digest"""
+
+		return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+	def is_permanent(self, url):
+		"""Determine whether the response for the specified URL should be kept indefinitely"""
+
+		with self.lock:
+			if url in self.permanent_urls:
+				return True
+
+		today = datetime.today().strftime('%Y-%m-%d')
+		for value in self.DATE_PATTERN.findall(urlparse(url).path):
+			try:
+				datetime.strptime(value, '%Y-%m-%d')
+			except ValueError:
+				continue
+			if value < today:
+				return True
+		return False
+
+	def load(self, url):
+		"""Return the archived response for the specified URL, or None if there is no such response or it has expired"""
+
+		with self.lock:
+			row = self.connection.execute('SELECT digest, status_code, encoding, fetched_at, permanent FROM responses WHERE url = ?', (url,)).fetchone()
+		if row is None:
+			return None
+
+		digest, status_code, encoding, fetched_at, permanent = row
+		if not self.replay and not permanent and fetched_at + self.expiry < time.time():
+			return None
+
+		try:
+			with open(self.get_object_path(digest), 'rb') as f:
+				content = zlib.decompress(f.read())
+		except (OSError, zlib.error):
+			return None
+
+		with self.lock, self.connection:
+			self.connection.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (time.time(), url))
+
+		return ArchivedResponse(url, status_code, content, encoding)
+
+	def store(self, url, response):
+		"""Add the specified response to the archive"""
+
+		content = response.content
+		digest = hashlib.sha256(content).hexdigest()
+		path = self.get_object_path(digest)
+		compressed = zlib.compress(content)
+
+		permanent = self.is_permanent(url)
+		now = time.time()
+		with self.lock, self.connection:
+			if not os.path.isfile(path):
+				os.makedirs(os.path.dirname(path), exist_ok=True)
+				with open(path + '.tmp', 'wb') as f:
+					f.write(compressed)
+				os.replace(path + '.tmp', path)
+				self.total_size += len(compressed)
+
+			previous = self.connection.execute('SELECT digest FROM responses WHERE url = ?', (url,)).fetchone()
+			self.connection.execute('INSERT OR REPLACE INTO responses (url, digest, status_code, encoding, size, fetched_at, accessed_at, permanent) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (url, digest, response.status_code, response.encoding, len(compressed), now, now, 1 if permanent else 0))
+			if previous is not None and previous[0] != digest:
+				self.remove_unreferenced(previous[0])
+
+		self.evict()
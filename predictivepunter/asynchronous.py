@@ -0,0 +1,156 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import threading
+import time
+from urllib.parse import urlparse
+
+import pyracing
+
+
+class HostRateLimiter:
+	"""Limit the rate of requests made to each host"""
+
+	def __init__(self, requests_per_second):
+		"""Initialize instance dependencies"""
+
+		self.interval = 1.0 / requests_per_second
+
+		self.next_times = {}
+		self.lock = threading.Lock()
+
+	def wait(self, url):
+		"""Block until a request can be made to the host of the specified URL without exceeding the rate limit"""
+
+		host = urlparse(url).netloc
+		with self.lock:
+			now = time.time()
+			next_time = max(self.next_times.get(host, now), now)
+			self.next_times[host] = next_time + self.interval
+
+		if next_time > now:
+			time.sleep(next_time - now)
+
+
+class RateLimitedSession:
+	"""Wrap an HTTP session so that all GET requests are subject to a rate limiter"""
+
+	def __init__(self, session, rate_limiter):
+		"""Initialize instance dependencies"""
+
+		self.session = session
+		self.rate_limiter = rate_limiter
+
+	def __getattr__(self, name):
+
+		return getattr(self.session, name)
+
+	def get(self, url, *args, **kwargs):
+		"""Wait for the rate limiter before performing a GET request via the wrapped session"""
+
+		self.rate_limiter.wait(url)
+		return self.session.get(url, *args, **kwargs)
+
+
+class AsyncBackend:
+	"""Traverse a processor's date range with asyncio, fetching meets, races, runners, horses and performances concurrently under an in-flight limit
+
+	The same pre_process_*, process_* and post_process_* hooks are called on the processor as for the threaded pyracing.Processor. As the underlying scraper and database calls are blocking, each one is run in a thread pool sized to the in-flight limit, while asyncio coordinates the traversal so that no thread ever waits on a child entity.
+	"""
+
+	def __init__(self, processor, max_in_flight=16):
+		"""Initialize instance dependencies"""
+
+		self.processor = processor
+		self.max_in_flight = max_in_flight
+
+		self.executor = None
+		self.loop = None
+		self.semaphore = None
+
+	async def call(self, target, *args):
+		"""Call the specified blocking target in the thread pool, subject to the in-flight limit"""
+
+		async with self.semaphore:
+			return await self.loop.run_in_executor(self.executor, target, *args)
+
+	async def call_hook(self, name, item):
+		"""Call the processor's hook with the specified name for the specified item, if the processor implements it"""
+
+		hook = getattr(self.processor, name, None)
+		if hook is not None:
+			await self.call(hook, item)
+
+	async def process_date(self, date):
+		"""Process all meets on the specified date"""
+
+		await self.call_hook('pre_process_date', date)
+		meets = await self.call(pyracing.Meet.get_meets_by_date, date)
+		await asyncio.gather(*[self.process_meet(meet) for meet in meets])
+		await self.call_hook('post_process_date', date)
+
+	async def process_horse(self, horse):
+		"""Process all performances for the specified horse"""
+
+		await self.call_hook('pre_process_horse', horse)
+		performances = await self.call(lambda: horse.performances)
+		await asyncio.gather(*[self.call_hook('process_performance', performance) for performance in performances])
+		await self.call_hook('post_process_horse', horse)
+
+	async def process_meet(self, meet):
+		"""Process all races for the specified meet"""
+
+		await self.call_hook('pre_process_meet', meet)
+		races = await self.call(lambda: meet.races)
+		await asyncio.gather(*[self.process_race(race) for race in races])
+		await self.call_hook('post_process_meet', meet)
+
+	async def process_race(self, race):
+		"""Process all runners for the specified race"""
+
+		await self.call_hook('pre_process_race', race)
+		runners = await self.call(lambda: race.runners)
+		await asyncio.gather(*[self.process_runner(runner) for runner in runners])
+		await self.call_hook('post_process_race', race)
+
+	async def process_runner(self, runner):
+		"""Process the horse, jockey and trainer for the specified runner"""
+
+		await self.call_hook('pre_process_runner', runner)
+
+		horse, jockey, trainer = await asyncio.gather(
+			self.call(lambda: runner.horse),
+			self.call(lambda: runner.jockey),
+			self.call(lambda: runner.trainer)
+			)
+
+		children = []
+		if horse is not None:
+			children.append(self.process_horse(horse))
+		if jockey is not None:
+			children.append(self.call_hook('process_jockey', jockey))
+		if trainer is not None:
+			children.append(self.call_hook('process_trainer', trainer))
+		await asyncio.gather(*children)
+
+		await self.call_hook('post_process_runner', runner)
+
+	def process_dates(self, date_from, date_to):
+		"""Process all dates in the specified range in order, processing the meets on each date concurrently"""
+
+		self.loop = asyncio.new_event_loop()
+		self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+
+		try:
+			asyncio.set_event_loop(self.loop)
+			self.semaphore = asyncio.Semaphore(self.max_in_flight)
+
+			date = date_from
+			while date <= date_to:
+				self.loop.run_until_complete(self.process_date(date))
+				date += timedelta(days=1)
+
+		finally:
+			self.executor.shutdown()
+			self.loop.close()
+			asyncio.set_event_loop(None)
@@ -0,0 +1,192 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import json
+import locale
+import logging
+import math
+import sys
+import threading
+import time
+
+import pyracing
+
+try:
+	from .predict import Prediction, PredictProcessor
+except SystemError:
+	from predict import Prediction, PredictProcessor
+
+
+class Backtest(PredictProcessor):
+	"""Evaluate predictions over a historical date range by walking forward through it
+
+	The range is divided into intervals of retrain_interval days. Predictors for each interval are trained only on races prior to the start of the interval and reused for every date within it, so that each segment is trained once per interval rather than once per date. As no interval depends on the predictions made in another, all dates in the range are evaluated in parallel, with the predictor cache ensuring each segment and interval is trained only once. Predictions made during a backtest are not saved to the database.
+	"""
+
+	PICKS = ('1st', '2nd', '3rd', '4th')
+
+	LONG_OPTIONS = [option for option in PredictProcessor.LONG_OPTIONS if option != 'batch-date'] + ['retrain-interval=', 'confidence-buckets=']
+
+	@classmethod
+	def get_default_configuration(cls):
+		"""Return a dictionary of the default configuration values, including those for the backtest options"""
+
+		configuration = super().get_default_configuration()
+		configuration.update({
+			'confidence_buckets':	4,
+			'retrain_interval':	7
+		})
+		return configuration
+
+	@classmethod
+	def set_option(cls, configuration, opt, arg):
+		"""Update the configuration with the value for the specified command-line option, including the backtest options"""
+
+		if opt == '--retrain-interval':
+			configuration['retrain_interval'] = int(arg)
+
+		elif opt == '--confidence-buckets':
+			configuration['confidence_buckets'] = int(arg)
+
+		else:
+			super().set_option(configuration, opt, arg)
+
+	def __init__(self, confidence_buckets=4, retrain_interval=7, threads=4, *args, **kwargs):
+		"""Initialize instance dependencies"""
+
+		super().__init__(csv_writer=None, message_prefix='backtesting', threads=threads, *args, **kwargs)
+
+		self.backtest_threads = threads
+		self.confidence_buckets = confidence_buckets
+		self.retrain_interval = retrain_interval
+
+		self.outcomes = []
+		self.outcomes_lock = threading.Lock()
+
+	def evaluate_date(self, date, cutoff_date):
+		"""Predict all races on the specified date using predictors trained on races prior to the specified cutoff date, and record the outcome of each prediction"""
+
+		races = [race for meet in pyracing.Meet.get_meets_by_date(date) for race in meet.races]
+
+		groups = {}
+		for race in races:
+			groups.setdefault(Prediction.get_segment(race), []).append(race)
+
+		outcomes = []
+		for segment in groups:
+			predictor = Prediction.get_predictor(groups[segment][0], date=cutoff_date)
+			for race, prediction in zip(groups[segment], Prediction.predict_races(predictor, groups[segment])):
+				outcomes.append(self.get_outcome(race, Prediction(prediction)))
+
+		with self.outcomes_lock:
+			self.outcomes.extend(outcomes)
+
+		logging.info('Evaluated {count} races on {date}'.format(count=len(outcomes), date=date.strftime(locale.nl_langinfo(locale.D_FMT))))
+
+	def get_cutoff_date(self, date_from, date):
+		"""Return the start of the retraining interval containing the specified date"""
+
+		if self.retrain_interval > 0:
+			return date_from + timedelta(days=((date - date_from).days // self.retrain_interval) * self.retrain_interval)
+		return date_from
+
+	def get_outcome(self, race, prediction):
+		"""Return a dictionary describing whether each pick in the specified prediction finished in the predicted position"""
+
+		positions = dict((runner['number'], runner.result) for runner in race.runners)
+
+		outcome = {
+			'race_id':		race['_id'],
+			'predicted':	prediction['results'] is not None,
+			'confidence':	prediction.confidence,
+			'hits':			[]
+		}
+		for position, pick in enumerate(prediction.picks, 1):
+			if pick is None or len(pick) < 1:
+				outcome['hits'].append(None)
+			else:
+				outcome['hits'].append(any(positions.get(number) == position for number in pick))
+		return outcome
+
+	def get_report(self):
+		"""Return a dictionary of hit rates for each pick, overall and for each confidence bucket"""
+
+		with self.outcomes_lock:
+			outcomes = list(self.outcomes)
+
+		def get_hit_rates(outcomes):
+			rates = {}
+			for index, name in enumerate(self.PICKS):
+				hits = [outcome['hits'][index] for outcome in outcomes if outcome['hits'][index] is not None]
+				rates[name] = {
+					'picks':	len(hits),
+					'hit_rate':	sum(hits) / len(hits) if len(hits) > 0 else None
+				}
+			return rates
+
+		predicted = [outcome for outcome in outcomes if outcome['predicted']]
+		report = {
+			'races':		len(outcomes),
+			'predicted':	len(predicted),
+			'picks':		get_hit_rates(predicted),
+			'confidence':	[]
+		}
+
+		confident = sorted([outcome for outcome in predicted if outcome['confidence'] is not None], key=lambda outcome: outcome['confidence'])
+		if len(confident) > 0 and self.confidence_buckets > 0:
+			bucket_size = math.ceil(len(confident) / self.confidence_buckets)
+			for index in range(0, len(confident), bucket_size):
+				bucket = confident[index:index + bucket_size]
+				report['confidence'].append({
+					'min_confidence':	bucket[0]['confidence'],
+					'max_confidence':	bucket[-1]['confidence'],
+					'races':			len(bucket),
+					'picks':			get_hit_rates(bucket)
+				})
+
+		return report
+
+	def run(self, date_from, date_to):
+		"""Evaluate all dates in the specified range and return a report of the results"""
+
+		self.outcomes = []
+		Prediction.clear_predictor_cache()
+
+		started_at = time.time()
+
+		dates = []
+		date = date_from
+		while date <= date_to:
+			dates.append(date)
+			date += timedelta(days=1)
+
+		with ThreadPoolExecutor(max_workers=self.backtest_threads) as executor:
+			for future in [executor.submit(self.evaluate_date, date, self.get_cutoff_date(date_from, date)) for date in dates]:
+				future.result()
+
+		self.flush_writes()
+
+		report = self.get_report()
+		report['date_from'] = date_from
+		report['date_to'] = date_to
+		report['retrain_interval'] = self.retrain_interval
+		report['predictors'] = len(Prediction.predictor_cache)
+		report['seconds'] = time.time() - started_at
+		return report
+
+
+def main():
+	"""Main entry point for the backtest console script"""
+
+	locale.setlocale(locale.LC_ALL, '')
+
+	configuration = Backtest.get_configuration(sys.argv[1:])
+
+	backtest = Backtest(**configuration)
+	report = backtest.run(date_from=configuration['date_from'], date_to=configuration['date_to'])
+
+	json.dump(report, sys.stdout, default=str, indent=4, sort_keys=True)
+	sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,165 @@
+from datetime import datetime
+from getopt import getopt
+import gzip
+import logging
+import os
+import sys
+import threading
+
+import bson
+import pymongo
+
+
+class IncrementalBackup:
+	"""Export documents saved since the last backup to timestamped per-collection archives"""
+
+	BATCH_SIZE = 1000
+	TIMESTAMP_FORMAT = '%Y%m%d%H%M%S%f'
+
+	def __init__(self, database, directory='backup'):
+		"""Initialize instance dependencies"""
+
+		self.database = database
+		self.directory = directory
+
+		self.saved_ids = {}
+		self.lock = threading.RLock()
+
+	def clear(self):
+		"""Forget all documents saved since the last backup"""
+
+		with self.lock:
+			self.saved_ids = {}
+
+	def export(self):
+		"""Export all documents saved since the last backup to a new timestamped directory of gzipped BSON archives, returning the directory path or None if there was nothing to export"""
+
+		with self.lock:
+			saved_ids = self.saved_ids
+			self.saved_ids = {}
+
+		if len(saved_ids) < 1:
+			return None
+
+		path = os.path.join(self.directory, self.database.name, datetime.now().strftime(self.TIMESTAMP_FORMAT))
+		os.makedirs(path, exist_ok=True)
+
+		for name in sorted(saved_ids):
+			ids = list(saved_ids[name])
+			with gzip.open(os.path.join(path, name + '.bson.gz'), 'wb') as f:
+				for index in range(0, len(ids), self.BATCH_SIZE):
+					for document in self.database[name].find({'_id': {'$in': ids[index:index + self.BATCH_SIZE]}}):
+						f.write(bson.BSON.encode(document))
+			logging.debug('Exported {count} {name} to {path}'.format(count=len(ids), name=name, path=path))
+
+		return path
+
+	def get_full_dump_path(self):
+		"""Return the path of the file recording the time of the last full dump of the database, which is kept alongside its archives"""
+
+		return os.path.join(self.directory, self.database.name + '.full_dump')
+
+	def get_last_full_dump(self):
+		"""Return the time of the last full dump of the database, or None if no full dump has been recorded"""
+
+		path = self.get_full_dump_path()
+		if os.path.isfile(path):
+			with open(path) as f:
+				return datetime.strptime(f.read().strip(), self.TIMESTAMP_FORMAT)
+
+	def record_full_dump(self, timestamp=None):
+		"""Record the time of a full dump of the database (defaulting to now), and forget all documents saved before it"""
+
+		if timestamp is None:
+			timestamp = datetime.now()
+
+		os.makedirs(self.directory, exist_ok=True)
+		with open(self.get_full_dump_path(), 'w') as f:
+			f.write(timestamp.strftime(self.TIMESTAMP_FORMAT))
+
+		self.clear()
+
+	def record(self, entity):
+		"""Record the fact that the specified entity has been saved"""
+
+		if '_id' in entity:
+			name = entity.get_database_collection().name
+			with self.lock:
+				if name not in self.saved_ids:
+					self.saved_ids[name] = set()
+				self.saved_ids[name].add(entity['_id'])
+
+	def restore(self, since=None):
+		"""Replay all archives (optionally only those with timestamps after since) into the database in chronological order"""
+
+		root = os.path.join(self.directory, self.database.name)
+		if not os.path.isdir(root):
+			return
+
+		for timestamp in sorted(os.listdir(root)):
+			if since is not None and timestamp <= since:
+				continue
+
+			path = os.path.join(root, timestamp)
+			for filename in sorted(os.listdir(path)):
+				if filename.endswith('.bson.gz'):
+					name = filename[:-len('.bson.gz')]
+					collection = self.database[name]
+
+					count = 0
+					requests = []
+					with gzip.open(os.path.join(path, filename), 'rb') as f:
+						for document in bson.decode_file_iter(f):
+							requests.append(pymongo.ReplaceOne({'_id': document['_id']}, document, upsert=True))
+							if len(requests) >= self.BATCH_SIZE:
+								collection.bulk_write(requests, ordered=False)
+								count += len(requests)
+								requests = []
+					if len(requests) > 0:
+						collection.bulk_write(requests, ordered=False)
+						count += len(requests)
+
+					logging.info('Restored {count} {name} from {path}'.format(count=count, name=name, path=path))
+
+
+def main():
+	"""Main entry point for the restore console script"""
+
+	configuration = {
+		'backup_directory':	'backup',
+		'database_name':	'predictivepunter',
+		'logging_level':	logging.INFO,
+		'mongo_uri':		None,
+		'since':			None
+	}
+
+	opts, args = getopt(sys.argv[1:], 'n:qv', ['backup-directory=', 'database-name=', 'mongo-uri=', 'quiet', 'since=', 'verbose'])
+
+	for opt, arg in opts:
+
+		if opt == '--backup-directory':
+			configuration['backup_directory'] = arg
+
+		elif opt in ('-n', '--database-name'):
+			configuration['database_name'] = arg
+
+		elif opt == '--mongo-uri':
+			configuration['mongo_uri'] = arg
+
+		elif opt in ('-q', '--quiet'):
+			configuration['logging_level'] = logging.WARNING
+
+		elif opt == '--since':
+			configuration['since'] = arg
+
+		elif opt in ('-v', '--verbose'):
+			configuration['logging_level'] = logging.DEBUG
+
+	logging.basicConfig(level=configuration['logging_level'])
+
+	backup = IncrementalBackup(pymongo.MongoClient(configuration['mongo_uri'])[configuration['database_name']], configuration['backup_directory'])
+	backup.restore(since=configuration['since'])
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,339 @@
+from datetime import datetime, timedelta
+from getopt import getopt
+import hashlib
+import json
+import locale
+import logging
+import random
+import sys
+import threading
+import time
+
+import pymongo
+
+try:
+	from .predict import PredictProcessor
+	from .scrape import ScrapeProcessor
+	from .seed import SeedProcessor
+except SystemError:
+	from predict import PredictProcessor
+	from scrape import ScrapeProcessor
+	from seed import SeedProcessor
+
+
+class SyntheticScraper:
+	"""A local stand-in for pypunters.Scraper that generates deterministic synthetic racing data"""
+
+	ENTRY_CONDITIONS = (['Maiden'], ['Class 1'], ['Class 3'], ['Benchmark 64'], ['Handicap'], ['Open'])
+	TRACK_CONDITIONS = ('Firm 2', 'Good 3', 'Good 4', 'Soft 5', 'Soft 7', 'Heavy 8', 'Synthetic')
+	DISTANCES = (1000, 1100, 1200, 1400, 1600, 2000, 2400)
+
+	def __init__(self, meets_per_date=2, races_per_meet=8, runners_per_race=10, performances_per_horse=10, horses=500, jockeys=80, trainers=60):
+		"""Initialize instance dependencies"""
+
+		self.meets_per_date = meets_per_date
+		self.races_per_meet = races_per_meet
+		self.runners_per_race = runners_per_race
+		self.performances_per_horse = performances_per_horse
+		self.horses = horses
+		self.jockeys = jockeys
+		self.trainers = trainers
+
+		self.starts = {}
+		self.tracks = {}
+		self.lock = threading.RLock()
+
+	def get_random(self, *keys):
+		"""Return a random number generator seeded deterministically from the specified keys"""
+
+		return random.Random(int(hashlib.md5(repr(keys).encode('utf-8')).hexdigest()[:8], 16))
+
+	def scrape_horse(self, runner):
+		"""Return a synthetic horse for the specified runner"""
+
+		generator = self.get_random(runner['horse_url'])
+		return {
+			'url':			runner['horse_url'],
+			'name':			'Synthetic Horse {number}'.format(number=runner['horse_url'].split('/')[-1]),
+			'colour':		generator.choice(('Bay', 'Brown', 'Chestnut', 'Grey')),
+			'sex':			generator.choice(('Colt', 'Filly', 'Gelding', 'Mare')),
+			'foaled':		datetime(2010 + generator.randint(0, 4), 8, 1),
+			'sire':			'Synthetic Sire {number}'.format(number=generator.randint(1, 50)),
+			'dam':			'Synthetic Dam {number}'.format(number=generator.randint(1, 200)),
+			'country':		'AUS'
+		}
+
+	def scrape_jockey(self, runner):
+		"""Return a synthetic jockey for the specified runner"""
+
+		return {
+			'url':	runner['jockey_url'],
+			'name':	'Synthetic Jockey {number}'.format(number=runner['jockey_url'].split('/')[-1])
+		}
+
+	def scrape_meets(self, date):
+		"""Return a list of synthetic meets for the specified date"""
+
+		return [
+			{
+				'date':		date,
+				'track':	'Synthetic Park {number}'.format(number=(date.toordinal() + number) % (self.meets_per_date * 3) + 1),
+				'url':		'synthetic://meets/{date}/{number}'.format(date=date.strftime('%Y-%m-%d'), number=number + 1)
+			}
+			for number in range(self.meets_per_date)
+			]
+
+	def scrape_performances(self, horse):
+		"""Return a list of synthetic performances for the specified horse, including its results in any synthetic races it has been entered in"""
+
+		generator = self.get_random(horse['url'], 'performances')
+
+		performances = []
+		for index in range(self.performances_per_horse):
+			starters = generator.randint(6, 16)
+			performances.append({
+				'horse_url':		horse['url'],
+				'jockey_url':		'synthetic://jockeys/{number}'.format(number=generator.randint(1, self.jockeys)),
+				'date':				datetime(2015, 1, 1) + timedelta(days=generator.randint(0, 364)),
+				'track':			'Synthetic Park {number}'.format(number=generator.randint(1, self.meets_per_date * 3)),
+				'distance':			generator.choice(self.DISTANCES),
+				'track_condition':	generator.choice(self.TRACK_CONDITIONS),
+				'result':			generator.randint(1, starters),
+				'starters':			starters,
+				'weight':			generator.randint(540, 620) / 10,
+				'carried':			generator.randint(540, 620) / 10,
+				'prize_money':		generator.choice((0, 0, 0, 1500, 3000, 6000, 20000)),
+				'starting_price':	generator.randint(15, 1000) / 10,
+				'lengths':			generator.randint(0, 100) / 10,
+				'winning_time':		generator.randint(570, 1500) / 10
+			})
+
+		with self.lock:
+			performances.extend(self.starts.get(horse['url'], []))
+
+		return performances
+
+	def scrape_races(self, meet):
+		"""Return a list of synthetic races for the specified meet"""
+
+		with self.lock:
+			self.tracks[meet['_id']] = meet['track']
+
+		generator = self.get_random(meet['url'])
+		return [
+			{
+				'meet_id':			meet['_id'],
+				'number':			number + 1,
+				'start_time':		meet['date'] + timedelta(hours=12, minutes=35 * number),
+				'distance':			generator.choice(self.DISTANCES),
+				'entry_conditions':	generator.choice(self.ENTRY_CONDITIONS),
+				'track_condition':	generator.choice(self.TRACK_CONDITIONS),
+				'prize_money':		generator.choice((20000, 35000, 50000, 100000)),
+				'url':				'{url}/races/{number}'.format(url=meet['url'], number=number + 1)
+			}
+			for number in range(self.races_per_meet)
+			]
+
+	def scrape_runners(self, race):
+		"""Return a list of synthetic runners for the specified race, recording each runner's result for its horse's performances"""
+
+		generator = self.get_random(race['url'])
+		horse_numbers = generator.sample(range(1, self.horses + 1), min(self.runners_per_race, self.horses))
+		results = list(range(1, len(horse_numbers) + 1))
+		generator.shuffle(results)
+
+		runners = []
+		for index, horse_number in enumerate(horse_numbers):
+			runner = {
+				'race_id':		race['_id'],
+				'number':		index + 1,
+				'barrier':		generator.randint(1, len(horse_numbers)),
+				'weight':		generator.randint(540, 620) / 10,
+				'is_scratched':	False,
+				'horse_url':	'synthetic://horses/{number}'.format(number=horse_number),
+				'jockey_url':	'synthetic://jockeys/{number}'.format(number=generator.randint(1, self.jockeys)),
+				'trainer_url':	'synthetic://trainers/{number}'.format(number=generator.randint(1, self.trainers))
+			}
+			runners.append(runner)
+
+			with self.lock:
+				if runner['horse_url'] not in self.starts:
+					self.starts[runner['horse_url']] = []
+				self.starts[runner['horse_url']].append({
+					'horse_url':		runner['horse_url'],
+					'jockey_url':		runner['jockey_url'],
+					'date':				race['start_time'].replace(hour=0, minute=0, second=0, microsecond=0),
+					'track':			self.tracks.get(race['meet_id']),
+					'distance':			race['distance'],
+					'track_condition':	race['track_condition'],
+					'result':			results[index],
+					'starters':			len(horse_numbers),
+					'weight':			runner['weight'],
+					'carried':			runner['weight'],
+					'prize_money':		0 if results[index] > 3 else race['prize_money'] / (2 ** results[index]),
+					'starting_price':	generator.randint(15, 1000) / 10,
+					'lengths':			generator.randint(0, 100) / 10,
+					'winning_time':		generator.randint(570, 1500) / 10
+				})
+
+		return runners
+
+	def scrape_trainer(self, runner):
+		"""Return a synthetic trainer for the specified runner"""
+
+		return {
+			'url':	runner['trainer_url'],
+			'name':	'Synthetic Trainer {number}'.format(number=runner['trainer_url'].split('/')[-1])
+		}
+
+
+class NullCsvWriter:
+	"""Count CSV rows without writing them anywhere"""
+
+	def __init__(self):
+		"""Initialize instance dependencies"""
+
+		self.rows = 0
+		self.lock = threading.Lock()
+
+	def writerow(self, row):
+
+		with self.lock:
+			self.rows += 1
+
+
+class Benchmark:
+	"""Time the scrape, seed and predict processors against synthetic data at several scales and thread counts"""
+
+	def __init__(self, database_name='predictivepunter_benchmark', date_from=datetime(2016, 2, 1), days=7, scales=(1, 2), thread_counts=(1, 4), logging_level=logging.WARNING, **scraper_options):
+		"""Initialize instance dependencies"""
+
+		self.database_name = database_name
+		self.date_from = date_from
+		self.days = days
+		self.scales = scales
+		self.thread_counts = thread_counts
+		self.logging_level = logging_level
+		self.scraper_options = scraper_options
+
+	def count_documents(self):
+		"""Return a dictionary of document counts for all collections in the benchmark database"""
+
+		database = pymongo.MongoClient()[self.database_name]
+		return dict((name, database[name].count()) for name in ('meets', 'races', 'runners', 'horses', 'performances', 'seeds', 'predictions'))
+
+	def run(self):
+		"""Run the benchmark at all scales and thread counts, and return a list of result dictionaries"""
+
+		results = []
+		for scale in self.scales:
+			for threads in self.thread_counts:
+
+				pymongo.MongoClient().drop_database(self.database_name)
+
+				options = dict(self.scraper_options)
+				options['meets_per_date'] = options.get('meets_per_date', 2) * scale
+				scraper = SyntheticScraper(**options)
+
+				date_to = self.date_from + timedelta(days=self.days - 1)
+				configuration = {
+					'database_name':	self.database_name,
+					'logging_level':	self.logging_level,
+					'scraper':			scraper,
+					'threads':			threads
+				}
+
+				for stage, processor_class, extra_configuration in (
+					('scrape', ScrapeProcessor, {}),
+					('seed', SeedProcessor, {}),
+					('predict', PredictProcessor, {'csv_writer': NullCsvWriter()})
+					):
+					processor = processor_class(**dict(configuration, **extra_configuration))
+
+					started_at = time.time()
+					processor.process_dates(self.date_from, date_to)
+					seconds = time.time() - started_at
+
+					counts = self.count_documents()
+					result = {
+						'stage':		stage,
+						'scale':		scale,
+						'threads':		threads,
+						'days':			self.days,
+						'seconds':		seconds,
+						'races':		counts['races'],
+						'races_per_second':	counts['races'] / seconds if seconds > 0 else None,
+						'documents':	counts
+					}
+					logging.info('{stage} at scale {scale} with {threads} threads took {seconds:.2f} seconds'.format(stage=stage, scale=scale, threads=threads, seconds=seconds))
+					results.append(result)
+
+		return results
+
+
+def main():
+	"""Main entry point for the benchmark console script"""
+
+	locale.setlocale(locale.LC_ALL, '')
+
+	configuration = {
+		'database_name':	'predictivepunter_benchmark',
+		'days':				7,
+		'logging_level':	logging.WARNING,
+		'scales':			(1, 2),
+		'thread_counts':	(1, 4)
+	}
+	output = sys.stdout
+
+	opts, args = getopt(sys.argv[1:], 'n:o:qv', ['database-name=', 'days=', 'horses=', 'meets=', 'output=', 'performances=', 'quiet', 'races=', 'runners=', 'scales=', 'threads=', 'verbose'])
+
+	for opt, arg in opts:
+
+		if opt in ('-n', '--database-name'):
+			configuration['database_name'] = arg
+
+		elif opt == '--days':
+			configuration['days'] = int(arg)
+
+		elif opt == '--horses':
+			configuration['horses'] = int(arg)
+
+		elif opt == '--meets':
+			configuration['meets_per_date'] = int(arg)
+
+		elif opt in ('-o', '--output'):
+			output = open(arg, 'w')
+
+		elif opt == '--performances':
+			configuration['performances_per_horse'] = int(arg)
+
+		elif opt in ('-q', '--quiet'):
+			configuration['logging_level'] = logging.ERROR
+
+		elif opt == '--races':
+			configuration['races_per_meet'] = int(arg)
+
+		elif opt == '--runners':
+			configuration['runners_per_race'] = int(arg)
+
+		elif opt == '--scales':
+			configuration['scales'] = [int(value) for value in arg.split(',')]
+
+		elif opt == '--threads':
+			configuration['thread_counts'] = [int(value) for value in arg.split(',')]
+
+		elif opt in ('-v', '--verbose'):
+			configuration['logging_level'] = logging.INFO
+
+	logging.basicConfig(level=configuration['logging_level'])
+
+	results = Benchmark(**configuration).run()
+	json.dump({'created_at': datetime.now().isoformat(), 'results': results}, output, indent=4, sort_keys=True)
+	output.write('\n')
+
+	if output is not sys.stdout:
+		output.close()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,189 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+import hashlib
+import logging
+import os
+import pickle
+import threading
+
+
+class PredictorCache:
+	"""Hold futures for trained predictors within an optional memory budget
+
+	Each completed predictor's size is estimated from the length of its pickled form. If a size limit (in bytes) is specified, completed predictors are evicted once the cache exceeds it, either least recently used first ('lru') or least frequently used first ('lfu'). If a spill directory is specified, the pickled form of each completed predictor is also written to it (outside the cache lock, so that other threads are not blocked), and evicted predictors are loaded from it again on their next lookup rather than being retrained. Eviction itself therefore never pickles or writes a predictor.
+	"""
+
+	def __init__(self, size_limit=0, spill_directory=None, policy='lru'):
+		"""Initialize instance dependencies"""
+
+		if policy not in ('lfu', 'lru'):
+			raise ValueError('Unknown predictor cache policy: {policy}'.format(policy=policy))
+
+		self.size_limit = size_limit
+		self.spill_directory = spill_directory
+		self.policy = policy
+
+		self.lock = threading.RLock()
+		self.reset()
+
+	def __contains__(self, key):
+
+		with self.lock:
+			return key in self.entries
+
+	def __len__(self):
+
+		with self.lock:
+			return len(self.entries)
+
+	def clear(self):
+		"""Remove all cached and spilled predictors"""
+
+		with self.lock:
+			logging.debug('Clearing predictor cache: {statistics}'.format(statistics=self.get_statistics()))
+			for path, size in self.spill_files.values():
+				try:
+					os.remove(path)
+				except OSError:
+					pass
+			self.reset()
+
+	def discard(self, key, future):
+		"""Remove the specified future from the cache if it is still cached under the specified key"""
+
+		with self.lock:
+			if self.entries.get(key) is future:
+				del self.entries[key]
+				self.total_size -= self.sizes.pop(key, 0)
+				self.uses.pop(key, None)
+
+	def evict(self, keep):
+		"""Evict completed predictors other than the one with the specified key until the cache is within its size limit, keeping track of those that can be reloaded from the spill directory
+
+		This method must be called while holding the lock.
+		"""
+
+		with self.lock:
+			while self.total_size > self.size_limit:
+				candidates = [key for key in self.entries if key != keep and key in self.sizes]
+				if len(candidates) < 1:
+					break
+				if self.policy == 'lfu':
+					key = min(candidates, key=lambda candidate: self.uses.get(candidate, 0))
+				else:
+					key = candidates[0]
+
+				del self.entries[key]
+				self.total_size -= self.sizes.pop(key)
+				self.uses.pop(key, None)
+				self.evictions += 1
+
+				if key in self.spill_files:
+					self.spilled[key] = self.spill_files[key][0]
+
+	def get_or_create(self, key):
+		"""Return a tuple of the future for the specified key and a flag indicating whether the future was created by this call, in which case the caller is responsible for resolving it via set_result or discarding it"""
+
+		with self.lock:
+			future = self.entries.get(key)
+			if future is not None:
+				self.hits += 1
+				self.entries.move_to_end(key)
+				self.uses[key] = self.uses.get(key, 0) + 1
+				return future, False
+
+			self.misses += 1
+			future = self.entries[key] = Future()
+			self.uses[key] = 1
+			return future, True
+
+	def get_spill_path(self, key):
+		"""Return the path to which the predictor for the specified key is spilled"""
+
+		return os.path.join(self.spill_directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.pickle')
+
+	def get_statistics(self):
+		"""Return a dictionary of cache counters"""
+
+		with self.lock:
+			return {
+				'entries':		len(self.entries),
+				'total_size':	self.total_size,
+				'hits':			self.hits,
+				'misses':		self.misses,
+				'evictions':	self.evictions,
+				'spilled':		len(self.spilled),
+				'spill_loads':	self.spill_loads
+			}
+
+	def load_spilled(self, key):
+		"""Return the spilled predictor for the specified key, or None if it has not been spilled"""
+
+		with self.lock:
+			path = self.spilled.pop(key, None)
+		if path is None:
+			return None
+
+		try:
+			with open(path, 'rb') as f:
+				predictor = pickle.load(f)
+		except (EOFError, OSError, pickle.UnpicklingError) as e:
+			logging.warning('Unable to load spilled predictor for {key}: {exception}'.format(key=key, exception=e))
+			with self.lock:
+				self.spill_files.pop(key, None)
+			return None
+
+		with self.lock:
+			self.spill_loads += 1
+		return predictor
+
+	def reset(self):
+		"""Reset all entries and counters"""
+
+		with self.lock:
+			self.entries = OrderedDict()
+			self.sizes = {}
+			self.uses = {}
+			self.spill_files = {}
+			self.spilled = {}
+			self.total_size = 0
+			self.hits = self.misses = self.evictions = self.spill_loads = 0
+
+	def set_result(self, key, future, predictor):
+		"""Resolve the specified future with the specified predictor, then account for its size and evict other predictors if necessary"""
+
+		future.set_result(predictor)
+
+		if self.size_limit > 0 and predictor is not None:
+
+			with self.lock:
+				spill_file = self.spill_files.get(key)
+			if spill_file is not None:
+				size = spill_file[1]
+			else:
+				data = pickle.dumps(predictor, pickle.HIGHEST_PROTOCOL)
+				size = len(data)
+				if self.spill_directory is not None:
+					self.spill(key, data)
+
+			with self.lock:
+				if self.entries.get(key) is future:
+					self.sizes[key] = size
+					self.total_size += size
+					self.evict(keep=key)
+
+	def spill(self, key, data):
+		"""Write the specified pickled predictor to the spill directory so that it can be reloaded if it is evicted"""
+
+		path = self.get_spill_path(key)
+		try:
+			os.makedirs(self.spill_directory, exist_ok=True)
+			with open(path + '.tmp', 'wb') as f:
+				f.write(data)
+			os.replace(path + '.tmp', path)
+		except OSError as e:
+			logging.warning('Unable to spill predictor for {key}: {exception}'.format(key=key, exception=e))
+			return
+
+		with self.lock:
+			self.spill_files[key] = (path, len(data))
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from getopt import getopt
 import locale
 import logging
@@ -16,114 +16,391 @@ import pyracing
 class CommandLineProcessor(pyracing.Processor):
 	"""Extend the pyracing Processor class with command-line functionality"""
 
+	ACKNOWLEDGE_DERIVED_WRITES = False
+	HOOKS = tuple(prefix + 'process_' + entity for prefix in ('pre_', '', 'post_') for entity in ('date', 'meet', 'race', 'runner', 'horse', 'jockey', 'trainer', 'performance'))
+
+	LONG_OPTIONS = ['backup-database', 'date=', 'database-name=', 'quiet', 'threads=', 'verbose', 'cache-expiry=', 'write-batch-size=', 'write-interval=', 'incremental-backup', 'backup-directory=', 'full-backup-interval=', 'backend=', 'max-in-flight=', 'rate-limit=', 'archive=', 'archive-size=', 'replay', 'instrument', 'instrument-output=', 'compact-seeds', 'compact-dtype=', 'distributed', 'job=', 'lease-seconds=', 'shard-meets', 'mongo-uri=', 'pool-size=', 'socket-timeout=', 'connect-timeout=', 'read-preference=', 'training-read-preference=', 'source-write-concern=', 'derived-write-concern=']
+
 	@classmethod
 	def get_configuration(cls, args):
-		"""Return a dictionary of configuration values based on the provided command-line arguments"""
+		"""Return a dictionary of configuration values based on the provided command-line arguments
+
+		Each subclass accepts the options in its LONG_OPTIONS list, with their defaults and handling provided by get_default_configuration and set_option.
+		"""
+
+		configuration = cls.get_default_configuration()
+
+		opts, args = getopt(args, 'bd:n:qt:vx:', cls.LONG_OPTIONS)
+		for opt, arg in opts:
+			cls.set_option(configuration, opt, arg)
+
+		return configuration
 
-		configuration = {
+	@classmethod
+	def get_default_configuration(cls):
+		"""Return a dictionary of the default configuration values for the options shared by all subcommands"""
+
+		return {
+			'archive_directory':	None,
+			'archive_size':		0,
+			'backend':			'threads',
 			'backup_database':	False,
+			'backup_directory':	'backup',
 			'cache_expiry':		60 * 10,	# 10 minutes
+			'compact_seeds':	None,
+			'connect_timeout':	0,
 			'database_name':	'predictivepunter',
 			'date_from':		datetime.today().replace(hour=0, minute=0, second=0, microsecond=0),
 			'date_to':			datetime.today().replace(hour=0, minute=0, second=0, microsecond=0),
+			'derived_write_concern':	'1',
+			'distributed':		False,
+			'full_backup_interval':	7,
+			'incremental_backup':	False,
+			'instrument':		False,
+			'instrument_output':	None,
+			'job':				None,
+			'lease_seconds':	300,
 			'logging_level':	logging.INFO,
-			'threads':			4
+			'max_in_flight':	16,
+			'mongo_uri':		None,
+			'pool_size':		0,
+			'rate_limit':		0,
+			'read_preference':	'primary',
+			'replay':			False,
+			'shard_meets':		False,
+			'socket_timeout':	0,
+			'source_write_concern':	'1',
+			'threads':			4,
+			'training_read_preference':	None,
+			'write_batch_size':	500,
+			'write_interval':	30
 		}
 
-		opts, args = getopt(args, 'bd:n:qt:vx:', ['backup-database', 'date=', 'database-name=', 'quiet', 'threads=', 'verbose', 'cache-expiry='])
+	@classmethod
+	def get_read_preference(cls, name):
+		"""Return the pymongo read preference with the specified name (e.g. primary or secondary_preferred), or None if name is None"""
 
-		for opt, arg in opts:
+		if name is not None:
+			if name.upper() not in ('PRIMARY', 'PRIMARY_PREFERRED', 'SECONDARY', 'SECONDARY_PREFERRED', 'NEAREST'):
+				raise ValueError('Unknown read preference: {name}'.format(name=name))
+			return getattr(pymongo.ReadPreference, name.upper())
 
-			if opt in ('-b', '--backup-database'):
-				configuration['backup_database'] = True
+	@classmethod
+	def get_write_concern(cls, value):
+		"""Return a pymongo write concern for the specified w value, which may be a number of nodes or a tag such as majority"""
 
-			elif opt in ('-d', '--date'):
-				dates = [datetime.strptime(value, locale.nl_langinfo(locale.D_FMT)) for value in arg.split('-')]
-				if len(dates) > 0:
-					configuration['date_from'] = configuration['date_to'] = dates[-1]
-					if len(dates) > 1:
-						configuration['date_from'] = dates[0]
+		if value.isdigit():
+			return pymongo.WriteConcern(w=int(value))
+		return pymongo.WriteConcern(w=value)
 
-			elif opt in ('-n', '--database-name'):
-				configuration['database_name'] = arg
+	@classmethod
+	def set_option(cls, configuration, opt, arg):
+		"""Update the configuration with the value for the specified command-line option shared by all subcommands"""
 
-			elif opt in ('-q', '--quiet'):
-				configuration['logging_level'] = logging.WARNING
+		if opt in ('-b', '--backup-database'):
+			configuration['backup_database'] = True
 
-			elif opt in ('-t', '--threads'):
-				configuration['threads'] = int(arg)
+		elif opt in ('-d', '--date'):
+			dates = [datetime.strptime(value, locale.nl_langinfo(locale.D_FMT)) for value in arg.split('-')]
+			if len(dates) > 0:
+				configuration['date_from'] = configuration['date_to'] = dates[-1]
+				if len(dates) > 1:
+					configuration['date_from'] = dates[0]
 
-			elif opt in ('-v', '--verbose'):
-				configuration['logging_level'] = logging.DEBUG
+		elif opt in ('-n', '--database-name'):
+			configuration['database_name'] = arg
 
-			elif opt in ('-x', '--cache-expiry'):
-				configuration['cache_expiry'] = int(arg)
+		elif opt in ('-q', '--quiet'):
+			configuration['logging_level'] = logging.WARNING
 
-		return configuration
+		elif opt in ('-t', '--threads'):
+			configuration['threads'] = int(arg)
+
+		elif opt in ('-v', '--verbose'):
+			configuration['logging_level'] = logging.DEBUG
+
+		elif opt in ('-x', '--cache-expiry'):
+			configuration['cache_expiry'] = int(arg)
+
+		elif opt == '--write-batch-size':
+			configuration['write_batch_size'] = int(arg)
+
+		elif opt == '--write-interval':
+			configuration['write_interval'] = int(arg)
+
+		elif opt == '--incremental-backup':
+			configuration['backup_database'] = True
+			configuration['incremental_backup'] = True
+
+		elif opt == '--backup-directory':
+			configuration['backup_directory'] = arg
+
+		elif opt == '--full-backup-interval':
+			configuration['full_backup_interval'] = int(arg)
+
+		elif opt == '--backend':
+			configuration['backend'] = arg
+
+		elif opt == '--max-in-flight':
+			configuration['max_in_flight'] = int(arg)
+
+		elif opt == '--rate-limit':
+			configuration['rate_limit'] = float(arg)
+
+		elif opt == '--archive':
+			configuration['archive_directory'] = arg
+
+		elif opt == '--archive-size':
+			configuration['archive_size'] = int(arg) * 1024 * 1024
+
+		elif opt == '--replay':
+			configuration['replay'] = True
+
+		elif opt == '--instrument':
+			configuration['instrument'] = True
+
+		elif opt == '--instrument-output':
+			configuration['instrument'] = True
+			configuration['instrument_output'] = arg
 
-	def __init__(self, backup_database=False, cache_expiry=600, database_name='predictivepunter', logging_level=logging.INFO, message_prefix='processing', threads=4, *args, **kwargs):
+		elif opt == '--compact-seeds':
+			configuration['compact_seeds'] = configuration['compact_seeds'] or 'float32'
+
+		elif opt == '--compact-dtype':
+			configuration['compact_seeds'] = arg
+
+		elif opt == '--distributed':
+			configuration['distributed'] = True
+
+		elif opt == '--job':
+			configuration['job'] = arg
+
+		elif opt == '--lease-seconds':
+			configuration['lease_seconds'] = int(arg)
+
+		elif opt == '--shard-meets':
+			configuration['distributed'] = True
+			configuration['shard_meets'] = True
+
+		elif opt == '--mongo-uri':
+			configuration['mongo_uri'] = arg
+
+		elif opt == '--pool-size':
+			configuration['pool_size'] = int(arg)
+
+		elif opt == '--socket-timeout':
+			configuration['socket_timeout'] = float(arg)
+
+		elif opt == '--connect-timeout':
+			configuration['connect_timeout'] = float(arg)
+
+		elif opt == '--read-preference':
+			cls.get_read_preference(arg)
+			configuration['read_preference'] = arg
+
+		elif opt == '--training-read-preference':
+			cls.get_read_preference(arg)
+			configuration['training_read_preference'] = arg
+
+		elif opt == '--source-write-concern':
+			configuration['source_write_concern'] = arg
+
+		elif opt == '--derived-write-concern':
+			configuration['derived_write_concern'] = arg
+
+	def __init__(self, archive_directory=None, archive_size=0, backend='threads', backup_database=False, backup_directory='backup', cache_expiry=600, compact_seeds=None, connect_timeout=0, database_name='predictivepunter', derived_write_concern='1', distributed=False, full_backup_interval=7, incremental_backup=False, instrument=False, instrument_output=None, job=None, lease_seconds=300, logging_level=logging.INFO, max_in_flight=16, message_prefix='processing', mongo_uri=None, pool_size=0, rate_limit=0, read_preference='primary', replay=False, scraper=None, shard_meets=False, socket_timeout=0, source_write_concern='1', threads=4, training_read_preference=None, write_batch_size=500, write_interval=30, *args, **kwargs):
 		"""Initialize instance dependencies"""
 
+		if self.ACKNOWLEDGE_DERIVED_WRITES and not self.get_write_concern(derived_write_concern).acknowledged:
+			raise ValueError('{name} re-reads the seeds and predictions it writes, so it cannot use unacknowledged derived writes'.format(name=self.__class__.__name__))
+
+		self.backend = backend
 		self.backup_database = backup_database
 		self.cache_expiry = cache_expiry
 		self.database_name = database_name
+		self.mongo_uri = mongo_uri
+		self.instrument = instrument
+		self.instrument_output = instrument_output
 		self.logging_level = logging_level
+		self.max_in_flight = max_in_flight
 
 		logging.basicConfig(level=self.logging_level)
 
-		self.database = pymongo.MongoClient()[self.database_name]
+		client_options = {'maxPoolSize': pool_size if pool_size > 0 else max(100, 2 * max(threads, max_in_flight))}
+		if socket_timeout > 0:
+			client_options['socketTimeoutMS'] = int(socket_timeout * 1000)
+		if connect_timeout > 0:
+			client_options['connectTimeoutMS'] = int(connect_timeout * 1000)
+		if self.instrument:
+			recorder.enable()
+			client_options['event_listeners'] = [CommandCounter(recorder)]
+		self.database = pymongo.MongoClient(mongo_uri, **client_options).get_database(self.database_name, read_preference=self.get_read_preference(read_preference), write_concern=self.get_write_concern(source_write_concern))
 		self.database_has_changed = False
 
+		self.full_backup_interval = full_backup_interval
+		self.incremental_backup = None
+		if incremental_backup:
+			self.incremental_backup = IncrementalBackup(self.database, backup_directory)
+
 		self.http_client = cache_requests.Session(ex=self.cache_expiry)
+		if rate_limit > 0:
+			self.http_client = RateLimitedSession(self.http_client, HostRateLimiter(rate_limit))
+		self.response_archive = None
+		if archive_directory is not None:
+			self.http_client = self.response_archive = ResponseArchive(archive_directory, session=self.http_client, expiry=self.cache_expiry, size_limit=archive_size, replay=replay)
 		self.html_parser = html.fromstring
-		self.scraper = pypunters.Scraper(self.http_client, self.html_parser)
+		self.scraper = scraper
+		if self.scraper is None:
+			self.scraper = pypunters.Scraper(self.http_client, self.html_parser)
+
+		self.lease_coordinator = None
+		if distributed:
+			self.lease_coordinator = LeaseCoordinator(self.database, job=job, lease_seconds=lease_seconds, shard_meets=shard_meets)
+
+		self.bulk_writer = None
+		if write_batch_size > 0:
+			self.bulk_writer = BulkWriter(batch_size=write_batch_size, flush_interval=write_interval)
 
 		pyracing.initialize(self.database, self.scraper)
+		IndexRegistry.initialize(self.database)
+		Metadata.initialize(self.database)
+		pyracing.add_subscriber('saved_meet', Metadata.handle_saved_meet)
+		pyracing.add_subscriber('saved_race', Metadata.handle_saved_race)
+		for entity in ('performance', 'race', 'runner'):
+			pyracing.add_subscriber('saved_' + entity, getattr(Seed, 'handle_saved_' + entity))
 		for entity in (Seed, Prediction):
+			entity.bulk_writer = self.bulk_writer
 			entity.initialize()
+		Seed.set_compact_dtype(compact_seeds)
+		Seed.training_read_preference = self.get_read_preference(training_read_preference)
+		Seed.write_concern = Prediction.write_concern = self.get_write_concern(derived_write_concern)
 		for entity in ('meet', 'race', 'runner', 'horse', 'jockey', 'trainer', 'performance', 'seed', 'prediction'):
 			pyracing.add_subscriber('saved_' + entity, self.handle_saved_event)
+		if self.response_archive is not None:
+			for entity in ('meet', 'race'):
+				pyracing.add_subscriber('saved_' + entity, self.handle_saved_page)
 
 		super().__init__(threads=threads, message_prefix=message_prefix)
 
+		if self.instrument:
+			for hook in self.HOOKS:
+				target = getattr(self, hook, None)
+				if callable(target):
+					setattr(self, hook, recorder.measured(hook)(target))
+
 	def handle_saved_event(self, entity):
 		"""Record the fact that the database has changed when an entity is saved"""
 
 		self.database_has_changed = True
 
+		if self.incremental_backup is not None:
+			self.incremental_backup.record(entity)
+
+	def handle_saved_page(self, entity):
+		"""Keep the archived page for the specified saved meet or race indefinitely if it is for a date before today"""
+
+		date = entity.get('date', entity.get('start_time'))
+		if date is not None and entity.get('url') is not None and date < datetime.today().replace(hour=0, minute=0, second=0, microsecond=0):
+			self.response_archive.add_permanent_url(entity['url'])
+
 	def dump_database(self):
-		"""Dump the database to the filesystem"""
+		"""Dump the database to the filesystem, exporting only the documents saved since the last backup if incremental backups are enabled and a full dump is not yet due
+
+		A full dump is due if none has been recorded in the backup directory, or if at least full_backup_interval days have elapsed since the last one, regardless of how many dates have been processed in between or by which process.
+		"""
 
 		if self.database_has_changed:
-			subprocess.check_call('mongodump --db {name}'.format(name=self.database_name), shell=True)
+
+			full_dump_due = self.incremental_backup is None
+			if not full_dump_due and self.full_backup_interval > 0:
+				last_full_dump = self.incremental_backup.get_last_full_dump()
+				full_dump_due = last_full_dump is None or datetime.now() - last_full_dump >= timedelta(days=self.full_backup_interval)
+
+			if full_dump_due:
+				started_at = datetime.now()
+				command = ['mongodump', '--db', self.database_name]
+				if self.mongo_uri is not None:
+					command.extend(['--uri', self.mongo_uri])
+				subprocess.check_call(command)
+				if self.incremental_backup is not None:
+					self.incremental_backup.record_full_dump(started_at)
+			else:
+				self.incremental_backup.export()
+
 			self.database_has_changed = False
 
+	def flush_writes(self):
+		"""Write any pending bulk upserts to the database, then discard any race counts and mark any seeds affected by the saved entities as stale"""
+
+		if self.bulk_writer is not None:
+			self.bulk_writer.flush()
+
+		Metadata.invalidate_race_counts()
+		Seed.invalidate_stale()
+
 	def post_process_date(self, date):
 		"""Handle the post_process_date event"""
 
+		self.flush_writes()
+
 		if self.backup_database:
 			self.dump_database()
 
 	def process_dates(self, date_from, date_to):
-		"""Wrap the process_dates method in log_time to log total execution time"""
-
-		log_time(
-			target=super().process_dates,
-			target_args=[
-				date_from,
-				date_to
-			],
-			message='{prefix} {date_from} to {date_to}'.format(
-				prefix=self.message_prefix,
-				date_from=date_from.strftime(locale.nl_langinfo(locale.D_FMT)),
-				date_to=date_to.strftime(locale.nl_langinfo(locale.D_FMT))
+		"""Wrap the process_dates method in log_time to log total execution time, flushing any pending writes on completion
+
+		In distributed mode, the date range is instead divided into work units that are shared with other workers via the lease coordinator, which calls this method again for each date unit it claims.
+		"""
+
+		if self.lease_coordinator is not None and not self.lease_coordinator.is_running:
+			self.lease_coordinator.process_dates(self, date_from, date_to)
+			return
+
+		target = super().process_dates
+		if self.backend == 'async':
+			target = AsyncBackend(self, max_in_flight=self.max_in_flight).process_dates
+
+		try:
+			log_time(
+				target=target,
+				target_args=[
+					date_from,
+					date_to
+				],
+				message='{prefix} {date_from} to {date_to}'.format(
+					prefix=self.message_prefix,
+					date_from=date_from.strftime(locale.nl_langinfo(locale.D_FMT)),
+					date_to=date_to.strftime(locale.nl_langinfo(locale.D_FMT))
+					)
 				)
-			)
+		finally:
+			self.flush_writes()
+
+			if self.instrument:
+				recorder.log_report()
+				if self.instrument_output is not None:
+					recorder.write_report(self.instrument_output)
 
 
 try:
+	from .archive import ResponseArchive
+	from .asynchronous import AsyncBackend, HostRateLimiter, RateLimitedSession
+	from .backup import IncrementalBackup
+	from .distribute import LeaseCoordinator
+	from .indexes import IndexRegistry
+	from .instrumentation import CommandCounter, recorder
+	from .metadata import Metadata
 	from .seed import Seed
 	from .predict import Prediction
+	from .writer import BulkWriter
 except SystemError:
+	from archive import ResponseArchive
+	from asynchronous import AsyncBackend, HostRateLimiter, RateLimitedSession
+	from backup import IncrementalBackup
+	from distribute import LeaseCoordinator
+	from indexes import IndexRegistry
+	from instrumentation import CommandCounter, recorder
+	from metadata import Metadata
 	from seed import Seed
-	from predict import Prediction
\ No newline at end of file
+	from predict import Prediction
+	from writer import BulkWriter
\ No newline at end of file
@@ -0,0 +1,199 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import socket
+import threading
+import time
+
+import pymongo
+import pyracing
+
+try:
+	from .indexes import IndexRegistry
+except SystemError:
+	from indexes import IndexRegistry
+
+
+class LeaseCoordinator:
+	"""Share the processing of a date range between workers on several hosts via a lease collection in the shared database
+
+	The date range is split into one work unit per date, or (if meets are sharded) one work unit per meet, with each date unit being expanded into meet units by the first worker to claim it. Workers claim units by atomically leasing them for lease_seconds, renew their leases with a heartbeat while processing, and mark units as done on completion. Units whose leases expire (e.g. because their worker died) are reassigned to the next worker looking for work, while units that fail or expire max_attempts times are marked as failed. When meets are sharded, each worker runs the processor's date hooks once for each date on which it processes meets, rather than once per meet.
+	"""
+
+	def __init__(self, database, job=None, lease_seconds=300, max_attempts=3, poll_interval=30, shard_meets=False, worker_id=None):
+		"""Initialize instance dependencies"""
+
+		self.database = database
+		self.job = job
+		self.lease_seconds = lease_seconds
+		self.max_attempts = max_attempts
+		self.poll_interval = poll_interval
+		self.shard_meets = shard_meets
+		self.worker_id = worker_id or '{host}:{pid}'.format(host=socket.gethostname(), pid=os.getpid())
+
+		self.is_running = False
+		self.lease_lost = threading.Event()
+		self.current_date = None
+
+	def claim(self, job):
+		"""Lease the earliest unit for the specified job that is pending or whose lease has expired, returning it or None if there is no such unit
+
+		Units whose leases have expired after max_attempts attempts (e.g. because they repeatedly kill their workers) are marked as failed rather than being leased again.
+		"""
+
+		now = datetime.now()
+		self.get_database_collection().update_many(
+			{'job': job, 'status': 'leased', 'expires_at': {'$lt': now}, 'attempts': {'$gte': self.max_attempts}},
+			{'$set': {'status': 'failed', 'worker': None, 'expires_at': None}}
+			)
+		return self.get_database_collection().find_one_and_update(
+			{'job': job, '$or': [{'status': 'pending'}, {'status': 'leased', 'expires_at': {'$lt': now}, 'attempts': {'$lt': self.max_attempts}}]},
+			{'$set': {'status': 'leased', 'worker': self.worker_id, 'leased_at': now, 'expires_at': now + timedelta(seconds=self.lease_seconds)}, '$inc': {'attempts': 1}},
+			sort=[('date', pymongo.ASCENDING), ('type', pymongo.ASCENDING)],
+			return_document=pymongo.ReturnDocument.AFTER
+			)
+
+	def complete(self, unit):
+		"""Mark the specified unit as done"""
+
+		self.get_database_collection().update_one({'_id': unit['_id'], 'worker': self.worker_id}, {'$set': {'status': 'done', 'completed_at': datetime.now()}})
+
+	def create_units(self, job, date_from, date_to):
+		"""Create a pending date unit for each date in the specified range that does not already have one"""
+
+		requests = []
+		date = date_from
+		while date <= date_to:
+			requests.append(pymongo.UpdateOne(
+				{'_id': '{job}:{date}'.format(job=job, date=date.strftime('%Y%m%d'))},
+				{'$setOnInsert': {'job': job, 'type': 'date', 'date': date, 'status': 'pending', 'attempts': 0}},
+				upsert=True
+				))
+			date += timedelta(days=1)
+
+		if len(requests) > 0:
+			self.get_database_collection().bulk_write(requests, ordered=False)
+
+	def end_date(self, processor):
+		"""Run the processor's post_process_date hook for the date of the meet units processed since the last call, if any"""
+
+		if self.current_date is not None:
+			date = self.current_date
+			self.current_date = None
+			if hasattr(processor, 'post_process_date'):
+				processor.post_process_date(date)
+
+	def expand(self, unit):
+		"""Create a pending meet unit for each meet on the specified date unit's date"""
+
+		requests = []
+		for meet in pyracing.Meet.get_meets_by_date(unit['date']):
+			requests.append(pymongo.UpdateOne(
+				{'_id': '{unit}:{meet}'.format(unit=unit['_id'], meet=meet['_id'])},
+				{'$setOnInsert': {'job': unit['job'], 'type': 'meet', 'date': unit['date'], 'meet_id': meet['_id'], 'status': 'pending', 'attempts': 0}},
+				upsert=True
+				))
+
+		if len(requests) > 0:
+			self.get_database_collection().bulk_write(requests, ordered=False)
+
+	def fail(self, unit):
+		"""Release the specified unit for another attempt, or mark it as failed if it has reached the maximum number of attempts"""
+
+		status = 'failed' if unit.get('attempts', 0) >= self.max_attempts else 'pending'
+		self.get_database_collection().update_one({'_id': unit['_id'], 'worker': self.worker_id}, {'$set': {'status': status, 'worker': None, 'expires_at': None}})
+
+	def get_database_collection(self):
+		"""Return the database collection in which leases are stored"""
+
+		return self.database['leases']
+
+	def get_job(self, processor, date_from, date_to):
+		"""Return the configured job name, or a default job name based on the processor and date range"""
+
+		if self.job is not None:
+			return self.job
+		return '{prefix}:{date_from}-{date_to}{suffix}'.format(prefix=processor.message_prefix, date_from=date_from.strftime('%Y%m%d'), date_to=date_to.strftime('%Y%m%d'), suffix=':meets' if self.shard_meets else '')
+
+	def heartbeat(self, unit, stopped):
+		"""Renew the lease on the specified unit until stopped is set, setting lease_lost if the lease has been reassigned"""
+
+		while not stopped.wait(self.lease_seconds / 3):
+			result = self.get_database_collection().update_one({'_id': unit['_id'], 'worker': self.worker_id, 'status': 'leased'}, {'$set': {'expires_at': datetime.now() + timedelta(seconds=self.lease_seconds)}})
+			if result.matched_count < 1:
+				logging.warning('Lost lease on {unit}'.format(unit=unit['_id']))
+				self.lease_lost.set()
+				break
+
+	def is_finished(self, job):
+		"""Determine whether any units for the specified job are still pending or leased"""
+
+		return self.get_database_collection().count({'job': job, 'status': {'$in': ['pending', 'leased']}}) < 1
+
+	def process(self, processor, unit):
+		"""Process the specified unit with the specified processor"""
+
+		if unit['type'] == 'date':
+			if self.shard_meets:
+				self.expand(unit)
+			else:
+				processor.process_dates(unit['date'], unit['date'])
+
+		elif unit['type'] == 'meet':
+			meet = pyracing.Meet.find_one({'_id': unit['meet_id']})
+			if meet is not None:
+				self.start_date(processor, unit['date'])
+				processor.process_meet(meet)
+
+	def process_dates(self, processor, date_from, date_to):
+		"""Claim and process units for the specified date range with the specified processor until all units are done or failed"""
+
+		job = self.get_job(processor, date_from, date_to)
+		IndexRegistry.create_index(self, [('job', pymongo.ASCENDING), ('status', pymongo.ASCENDING), ('date', pymongo.ASCENDING)])
+		self.create_units(job, date_from, date_to)
+
+		self.is_running = True
+		try:
+			while True:
+
+				unit = self.claim(job)
+				if unit is None:
+					self.end_date(processor)
+					if self.is_finished(job):
+						break
+					time.sleep(self.poll_interval)
+					continue
+
+				logging.info('{worker} processing {unit}'.format(worker=self.worker_id, unit=unit['_id']))
+
+				self.lease_lost.clear()
+				stopped = threading.Event()
+				heartbeat = threading.Thread(target=self.heartbeat, args=(unit, stopped), daemon=True)
+				heartbeat.start()
+
+				try:
+					self.process(processor, unit)
+				except Exception:
+					logging.exception('Failed to process {unit}'.format(unit=unit['_id']))
+					self.fail(unit)
+				else:
+					if not self.lease_lost.is_set():
+						self.complete(unit)
+				finally:
+					stopped.set()
+					heartbeat.join()
+
+		finally:
+			try:
+				self.end_date(processor)
+			finally:
+				self.is_running = False
+
+	def start_date(self, processor, date):
+		"""Run the processor's date hooks when it starts processing meet units for a different date"""
+
+		if date != self.current_date:
+			self.end_date(processor)
+			if hasattr(processor, 'pre_process_date'):
+				processor.pre_process_date(date)
+			self.current_date = date
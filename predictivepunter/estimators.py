@@ -0,0 +1,315 @@
+import concurrent.futures
+import logging
+import math
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+
+import numpy
+from sklearn import feature_selection, linear_model, pipeline, svm, tree
+
+try:
+	from .instrumentation import recorder
+except SystemError:
+	from instrumentation import recorder
+
+
+HALVING_FRACTIONS = (0.25, 0.5, 1.0)
+
+
+class CandidateHistory:
+	"""Record the outcomes of candidate estimators for each segment so that estimators which consistently lose or time out can be skipped
+
+	Skipped estimators are not excluded permanently: every retry_every trainings of a segment, all estimators are tried again, so that an estimator which has become competitive (e.g. as the segment's training data grows) can win and have its losses reset.
+	"""
+
+	def __init__(self, skip_after=3, retry_every=5):
+		"""Initialize instance dependencies"""
+
+		self.skip_after = skip_after
+		self.retry_every = retry_every
+
+		self.losses = {}
+		self.trainings = {}
+		self.lock = threading.RLock()
+
+	def get_candidates(self, segment, names):
+		"""Return the subset of the specified estimator names to try for the next training of the specified segment, which is all of them if none would otherwise remain or a periodic retry is due"""
+
+		with self.lock:
+			self.trainings[segment] = self.trainings.get(segment, 0) + 1
+			if self.retry_every > 0 and self.trainings[segment] % self.retry_every == 0:
+				return list(names)
+			return [name for name in names if not self.should_skip(segment, name)] or list(names)
+
+	def record(self, segment, name, won):
+		"""Record a win or a loss (including a timeout) for the specified estimator in the specified segment"""
+
+		with self.lock:
+			if segment not in self.losses:
+				self.losses[segment] = {}
+			if won:
+				self.losses[segment][name] = 0
+			else:
+				self.losses[segment][name] = self.losses[segment].get(name, 0) + 1
+
+	def should_skip(self, segment, name):
+		"""Determine whether the specified estimator has lost often enough in the specified segment to be skipped"""
+
+		if self.skip_after < 1:
+			return False
+		with self.lock:
+			return self.losses.get(segment, {}).get(name, 0) >= self.skip_after
+
+
+class EstimatorPool:
+	"""A pool of worker processes for fitting candidate estimators, which can be recycled to stop fits that are still running after their deadline
+
+	A running fit cannot be cancelled, so each worker records its process ID before fitting, and the workers running overdue fits are terminated and the pool replaced with a fresh one. Fits submitted by other threads to the replaced pool fail, and are treated as failed candidates.
+	"""
+
+	def __init__(self, processes):
+		"""Initialize instance dependencies"""
+
+		self.processes = processes
+		self.lock = threading.RLock()
+		self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+
+	def recycle(self, pids):
+		"""Terminate the worker processes with the specified process IDs and replace the pool"""
+
+		with self.lock:
+			for pid in pids:
+				try:
+					os.kill(pid, signal.SIGTERM)
+				except OSError:
+					pass
+			self.executor.shutdown(wait=False)
+			self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.processes)
+
+	def shutdown(self, wait=True):
+		"""Shut down the pool's worker processes"""
+
+		with self.lock:
+			self.executor.shutdown(wait=wait)
+
+	def submit(self, fn, *args):
+		"""Schedule the specified function to be called with the specified arguments by a worker process, returning a future"""
+
+		with self.lock:
+			return self.executor.submit(fn, *args)
+
+
+def create_classifier(estimator):
+	"""Return a pipeline that selects features using the specified estimator before fitting it"""
+
+	return pipeline.Pipeline([
+		('feature_selection', feature_selection.SelectFromModel(estimator, 'mean')),
+		('regression', estimator)
+		])
+
+
+def create_estimators(train_X):
+	"""Return a list of all candidate estimators appropriate for the specified training data"""
+
+	dual = len(train_X) < len(train_X[0])
+	kernel = 'linear'
+	loss = 'epsilon_insensitive'
+	if not dual:
+		loss = 'squared_epsilon_insensitive'
+
+	return [
+		linear_model.BayesianRidge(),
+		linear_model.ElasticNet(),
+		linear_model.LinearRegression(),
+		linear_model.LogisticRegression(),
+		linear_model.OrthogonalMatchingPursuit(),
+		linear_model.PassiveAggressiveRegressor(),
+		linear_model.Perceptron(),
+		linear_model.Ridge(),
+		linear_model.SGDRegressor(),
+		svm.SVR(kernel=kernel),
+		svm.LinearSVR(dual=dual, loss=loss),
+		svm.NuSVR(kernel=kernel),
+		tree.DecisionTreeRegressor(),
+		tree.ExtraTreeRegressor()
+		]
+
+
+def fit_candidate(index, directory, rows=None, pid_filename=None):
+	"""Fit the candidate estimator at the specified index using the memory-mapped training and test data in the specified directory, optionally restricted to the specified training rows
+
+	This function is executed in worker processes, so it loads the shared data itself rather than receiving it as pickled arguments. If a pid_filename is specified, the worker's process ID is first written to that file in the directory, so that the worker can be terminated if the fit overruns its deadline.
+	"""
+
+	if pid_filename is not None:
+		with open(os.path.join(directory, pid_filename), 'w') as f:
+			f.write(str(os.getpid()))
+
+	data = {}
+	for name in ('train_X', 'train_y', 'test_X', 'test_y'):
+		data[name] = numpy.load(os.path.join(directory, name + '.npy'), mmap_mode='c')
+
+	train_X = data['train_X']
+	train_y = data['train_y']
+	if rows is not None:
+		rows = numpy.load(os.path.join(directory, rows), mmap_mode='r')
+		train_X = train_X[rows]
+		train_y = train_y[rows]
+
+	classifier = create_classifier(create_estimators(data['train_X'])[index])
+	classifier.fit(train_X, train_y)
+
+	return classifier, classifier.score(data['test_X'], data['test_y'])
+
+
+def fit_candidates(indices, names, data, segment, rows=None, executor=None, directory=None, deadline=None):
+	"""Fit the candidate estimators at the specified indices and return a dictionary mapping each index to a (classifier, score) tuple, None if fitting failed or False if it timed out
+
+	Without an executor, the candidates are fitted one after another and the deadline is only checked between fits, so a single fit may overrun it. With an executor (an EstimatorPool), fits still running at the deadline are stopped by recycling the workers running them.
+	"""
+
+	results = {}
+
+	if executor is None:
+
+		train_X = data['train_X']
+		train_y = data['train_y']
+		if rows is not None:
+			train_X = train_X[rows]
+			train_y = train_y[rows]
+
+		estimators = create_estimators(data['train_X'])
+		for index in indices:
+			if deadline is not None and time.time() >= deadline:
+				results[index] = False
+				continue
+
+			logging.debug('Trying {estimator} for {segment}'.format(estimator=names[index], segment=segment))
+
+			try:
+				classifier = create_classifier(estimators[index])
+				with recorder.measure('fit_' + names[index]):
+					classifier.fit(train_X, train_y)
+				results[index] = (classifier, classifier.score(data['test_X'], data['test_y']))
+			except BaseException as e:
+				logging.debug('Caught exception while trying {estimator} for {segment}: {exception}'.format(estimator=names[index], segment=segment, exception=e))
+				results[index] = None
+
+	else:
+
+		rows_filename = None
+		if rows is not None:
+			rows_filename = 'rows-{size}.npy'.format(size=len(rows))
+			numpy.save(os.path.join(directory, rows_filename), rows)
+
+		futures = {}
+		pid_filenames = {}
+		for index in indices:
+			logging.debug('Trying {estimator} for {segment}'.format(estimator=names[index], segment=segment))
+			pid_filenames[index] = 'fit-{index}-{rows}.pid'.format(index=index, rows=len(rows) if rows is not None else 'all')
+			futures[executor.submit(fit_candidate, index, directory, rows_filename, pid_filenames[index])] = index
+
+		timeout = None
+		if deadline is not None:
+			timeout = max(deadline - time.time(), 0)
+		with recorder.measure('fit_estimators'):
+			done, not_done = concurrent.futures.wait(futures, timeout=timeout)
+
+		overdue_pids = []
+		for future in not_done:
+			if not future.cancel():
+				path = os.path.join(directory, pid_filenames[futures[future]])
+				if os.path.isfile(path):
+					with open(path) as f:
+						overdue_pids.append(int(f.read()))
+			results[futures[future]] = False
+		if len(not_done) > 0 and not all(future.cancelled() for future in not_done):
+			logging.debug('Recycling estimator workers after {count} fits overran the deadline for {segment}'.format(count=len(not_done), segment=segment))
+			executor.recycle(overdue_pids)
+
+		for future in done:
+			try:
+				results[futures[future]] = future.result()
+			except BaseException as e:
+				logging.debug('Caught exception while trying {estimator} for {segment}: {exception}'.format(estimator=names[futures[future]], segment=segment, exception=e))
+				results[futures[future]] = None
+
+	return results
+
+
+def select_estimator(train_X, train_y, test_X, test_y, segment, executor=None, budget=None, history=None):
+	"""Fit candidate estimators to the training data and return a (classifier, score, estimator name) tuple for the candidate with the best test score
+
+	If an executor (an EstimatorPool) is specified, candidates are fitted in parallel by its worker processes, which share the training and test data via memory-mapped files.
+
+	If a budget (in seconds) is specified, candidates are selected by successive halving: all candidates are first scored on a subsample of the training data, and only the better half are promoted to each larger subsample until the full training data is reached or the budget is exhausted. The best-scoring fit completed at any stage is returned. Without an executor, the deadline is only checked between fits, so a fit that starts before the deadline is completed and may be used even if it finishes after it. If a history is specified, estimators that consistently lose or time out in the segment are skipped, and the outcome of this selection is recorded.
+	"""
+
+	data = {
+		'train_X':	numpy.asarray(train_X, dtype=float),
+		'train_y':	numpy.asarray(train_y),
+		'test_X':	numpy.asarray(test_X, dtype=float),
+		'test_y':	numpy.asarray(test_y)
+	}
+
+	names = [estimator.__class__.__name__ for estimator in create_estimators(data['train_X'])]
+	indices = list(range(len(names)))
+	if history is not None:
+		candidate_names = history.get_candidates(segment, names)
+		indices = [index for index in indices if names[index] in candidate_names]
+	candidates = list(indices)
+
+	fractions = [1.0]
+	deadline = None
+	if budget is not None and budget > 0:
+		fractions = list(HALVING_FRACTIONS)
+		deadline = time.time() + budget
+
+	directory = None
+	if executor is not None:
+		directory = tempfile.mkdtemp(prefix='predictivepunter-')
+		for name in data:
+			numpy.save(os.path.join(directory, name + '.npy'), data[name])
+
+	try:
+
+		random_state = numpy.random.RandomState(len(data['train_y']))
+		best = (None, None, None)
+
+		for stage, fraction in enumerate(fractions):
+
+			rows = None
+			sample_size = int(math.ceil(len(data['train_y']) * fraction))
+			if sample_size < len(data['train_y']):
+				rows = numpy.sort(random_state.choice(len(data['train_y']), sample_size, replace=False))
+
+			results = fit_candidates(indices, names, data, segment, rows=rows, executor=executor, directory=directory, deadline=deadline)
+
+			scored = [(results[index][1], index, results[index][0]) for index in indices if results.get(index)]
+
+			if len(scored) > 0:
+				for score, index, classifier in scored:
+					if best[0] is None or best[1] is None or score > best[1]:
+						best = (classifier, score, names[index])
+				logging.debug('Using {estimator} ({score}) for {segment} after fitting {fraction:.0%} of training data'.format(estimator=best[2], score=best[1], segment=segment, fraction=fraction))
+
+			if len(scored) < 1 or (deadline is not None and time.time() >= deadline):
+				break
+
+			if stage < len(fractions) - 1:
+				scored.sort(key=lambda item: (-item[0], item[1]))
+				indices = sorted(index for score, index, classifier in scored[:int(math.ceil(len(scored) / 2))])
+
+		if history is not None:
+			for index in candidates:
+				history.record(segment, names[index], names[index] == best[2])
+
+		return best
+
+	finally:
+		if directory is not None:
+			shutil.rmtree(directory, ignore_errors=True)
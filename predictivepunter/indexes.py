@@ -0,0 +1,41 @@
+import threading
+
+
+class IndexRegistry:
+	"""Create the database indexes used by predictivepunter once per database, recording each index created in an indexes collection so that later runs skip it
+
+	The recorded indexes are read in a single query when the registry is initialized, so a run against a database in which all indexes have been recorded sends no index commands. Dropping the database also drops the records, but an index whose collection alone is dropped is only recreated once its record has been removed from the indexes collection.
+	"""
+
+	database = None
+
+	recorded = set()
+	lock = threading.RLock()
+
+	@classmethod
+	def create_index(cls, entity, keys):
+		"""Create the specified index on the specified entity's collection and record it, unless it has already been recorded"""
+
+		collection = entity.get_database_collection()
+		id = '{name}:{keys}'.format(name=collection.name, keys=','.join('{key}_{direction}'.format(key=key, direction=direction) for key, direction in keys))
+
+		if id not in cls.recorded:
+			collection.create_index(keys)
+			cls.get_database_collection().replace_one({'_id': id}, {'_id': id, 'collection': collection.name, 'keys': [list(key) for key in keys]}, upsert=True)
+			with cls.lock:
+				cls.recorded.add(id)
+
+	@classmethod
+	def get_database_collection(cls):
+		"""Return the database collection in which created indexes are recorded"""
+
+		return cls.database['indexes']
+
+	@classmethod
+	def initialize(cls, database):
+		"""Initialize class dependencies, reading the indexes already recorded for the database"""
+
+		cls.database = database
+
+		with cls.lock:
+			cls.recorded = set(document['_id'] for document in cls.get_database_collection().find({}, {'_id': 1}))
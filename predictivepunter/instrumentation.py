@@ -0,0 +1,178 @@
+from contextlib import contextmanager
+import functools
+import json
+import logging
+import threading
+import time
+
+from pymongo import monitoring
+
+
+class Instrumentation:
+	"""Record latency histograms and database command counts for each named stage of processing
+
+	Stages are measured with the measure context manager (or the measured decorator) and may be nested, in which case each stage's latency includes the latency of its nested stages, while database commands are attributed only to the innermost stage in the calling thread. Recording is disabled until enable is called, so that measuring has negligible cost by default.
+	"""
+
+	BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+	def __init__(self):
+		"""Initialize instance dependencies"""
+
+		self.enabled = False
+
+		self.stages = {}
+		self.lock = threading.Lock()
+		self.local = threading.local()
+
+	def enable(self):
+		"""Enable recording"""
+
+		self.enabled = True
+
+	def get_stage(self, name):
+		"""Return the statistics dictionary for the stage with the specified name, creating it if necessary"""
+
+		if name not in self.stages:
+			self.stages[name] = {
+				'calls':			0,
+				'seconds':			0.0,
+				'min_seconds':		None,
+				'max_seconds':		None,
+				'histogram':		[0 for bucket in self.BUCKETS] + [0],
+				'commands':			0,
+				'command_seconds':	0.0
+			}
+		return self.stages[name]
+
+	@property
+	def current_stage(self):
+		"""Return the name of the innermost stage being measured in the calling thread"""
+
+		stack = getattr(self.local, 'stack', None)
+		if stack:
+			return stack[-1]
+		return 'unmeasured'
+
+	@contextmanager
+	def measure(self, name):
+		"""Measure the latency of the enclosed block as the stage with the specified name"""
+
+		if not self.enabled:
+			yield
+			return
+
+		if not hasattr(self.local, 'stack'):
+			self.local.stack = []
+		self.local.stack.append(name)
+		started_at = time.time()
+
+		try:
+			yield
+		finally:
+			seconds = time.time() - started_at
+			self.local.stack.pop()
+
+			with self.lock:
+				stage = self.get_stage(name)
+				stage['calls'] += 1
+				stage['seconds'] += seconds
+				if stage['min_seconds'] is None or seconds < stage['min_seconds']:
+					stage['min_seconds'] = seconds
+				if stage['max_seconds'] is None or seconds > stage['max_seconds']:
+					stage['max_seconds'] = seconds
+				for index, bucket in enumerate(self.BUCKETS):
+					if seconds <= bucket:
+						stage['histogram'][index] += 1
+						break
+				else:
+					stage['histogram'][-1] += 1
+
+	def measured(self, name):
+		"""Return a decorator that measures each call to the decorated function as the stage with the specified name"""
+
+		def decorator(target):
+
+			@functools.wraps(target)
+			def wrapper(*args, **kwargs):
+				with self.measure(name):
+					return target(*args, **kwargs)
+
+			return wrapper
+
+		return decorator
+
+	def record_command(self, stage_name, seconds):
+		"""Record a database command issued by the specified stage"""
+
+		with self.lock:
+			stage = self.get_stage(stage_name)
+			stage['commands'] += 1
+			stage['command_seconds'] += seconds
+
+	def get_report(self):
+		"""Return a dictionary of statistics for all stages"""
+
+		with self.lock:
+			report = {}
+			for name, stage in self.stages.items():
+				report[name] = dict(stage)
+				report[name]['histogram'] = dict(zip(['<={bucket}'.format(bucket=bucket) for bucket in self.BUCKETS] + ['>{bucket}'.format(bucket=self.BUCKETS[-1])], stage['histogram']))
+				report[name]['mean_seconds'] = stage['seconds'] / stage['calls'] if stage['calls'] > 0 else None
+			return report
+
+	def log_report(self):
+		"""Log a summary of the statistics for all stages, slowest first"""
+
+		report = self.get_report()
+		for name in sorted(report, key=lambda name: report[name]['seconds'], reverse=True):
+			stage = report[name]
+			logging.info('{name}: {calls} calls, {seconds:.3f}s total, {mean}s mean, {commands} database commands ({command_seconds:.3f}s)'.format(
+				name=name,
+				calls=stage['calls'],
+				seconds=stage['seconds'],
+				mean='{value:.4f}'.format(value=stage['mean_seconds']) if stage['mean_seconds'] is not None else '-',
+				commands=stage['commands'],
+				command_seconds=stage['command_seconds']
+				))
+
+	def write_report(self, filename):
+		"""Write the statistics for all stages to the specified file as JSON"""
+
+		with open(filename, 'w') as f:
+			json.dump(self.get_report(), f, indent=4, sort_keys=True)
+
+
+class CommandCounter(monitoring.CommandListener):
+	"""Attribute database commands to the stage being measured in the thread that issued them"""
+
+	def __init__(self, instrumentation):
+		"""Initialize instance dependencies"""
+
+		self.instrumentation = instrumentation
+
+		self.stages = {}
+		self.lock = threading.Lock()
+
+	def failed(self, event):
+
+		self.finished(event)
+
+	def finished(self, event):
+		"""Record a completed command against the stage that started it"""
+
+		with self.lock:
+			stage_name = self.stages.pop(event.request_id, self.instrumentation.current_stage)
+		self.instrumentation.record_command(stage_name, event.duration_micros / 1000000)
+
+	def started(self, event):
+
+		with self.lock:
+			self.stages[event.request_id] = self.instrumentation.current_stage
+
+	def succeeded(self, event):
+
+		self.finished(event)
+
+
+recorder = Instrumentation()
@@ -0,0 +1,227 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import hashlib
+import locale
+import logging
+import sys
+import time
+
+from jtgpy.threaded_queues import QueuedCsvWriter
+import pyracing
+
+try:
+	from .instrumentation import recorder
+	from .predict import Prediction, PredictProcessor
+	from .seed import Seed
+except SystemError:
+	from instrumentation import recorder
+	from predict import Prediction, PredictProcessor
+	from seed import Seed
+
+
+class LiveProcessor(PredictProcessor):
+	"""Keep predictions for the races in the specified date range up to date as race day changes are published
+
+	After predicting all races in the range as the predict processor does, the races that have not yet started are polled every poll_interval seconds. Each poll rescrapes those races and their runners and compares a fingerprint of the fields that affect seeding and segmentation (distance, entry conditions, track condition and the runner list including scratchings) against the previous poll. Only races whose fingerprint has changed are updated in the database and have their seeds regenerated and their predictions remade, reusing the predictors already in memory for unchanged segments. The updated CSV rows are written as soon as they are produced.
+	"""
+
+	RACE_KEYS = ('distance', 'entry_conditions', 'track_condition')
+	RUNNER_KEYS = ('number', 'is_scratched', 'barrier', 'weight', 'horse_url', 'jockey_url', 'trainer_url')
+
+	LONG_OPTIONS = PredictProcessor.LONG_OPTIONS + ['poll-interval=']
+
+	@classmethod
+	def get_default_configuration(cls):
+		"""Return a dictionary of the default configuration values, including those for the live polling options"""
+
+		configuration = super().get_default_configuration()
+		configuration.update({
+			'poll_interval':	60
+		})
+		return configuration
+
+	@classmethod
+	def set_option(cls, configuration, opt, arg):
+		"""Update the configuration with the value for the specified command-line option, including the live polling options"""
+
+		if opt == '--poll-interval':
+			configuration['poll_interval'] = int(arg)
+
+		else:
+			super().set_option(configuration, opt, arg)
+
+	def __init__(self, csv_writer, cache_expiry=600, poll_interval=60, threads=4, *args, **kwargs):
+		"""Initialize instance dependencies, limiting the HTTP cache expiry to the poll interval so that each poll sees fresh responses"""
+
+		super().__init__(csv_writer=csv_writer, cache_expiry=min(cache_expiry, poll_interval), message_prefix='live', threads=threads, *args, **kwargs)
+
+		self.poll_interval = poll_interval
+		self.live_threads = threads
+
+		self.fingerprints = {}
+		self.unlisted = set()
+
+	@classmethod
+	def get_fingerprint(cls, race, runners):
+		"""Return a digest of the specified race's and runners' values that affect its seeds and prediction"""
+
+		values = [race.get(key) for key in cls.RACE_KEYS]
+		for runner in sorted(runners, key=lambda runner: runner['number']):
+			values.append(tuple(runner.get(key) for key in cls.RUNNER_KEYS))
+		return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+	def get_open_races(self, date_from, date_to):
+		"""Return a list of the races in the specified date range that have not yet started"""
+
+		now = datetime.now()
+
+		races = []
+		date = date_from
+		while date <= date_to:
+			races.extend([race for meet in pyracing.Meet.get_meets_by_date(date) for race in meet.races if race['start_time'] > now])
+			date += timedelta(days=1)
+		return races
+
+	def poll(self, races):
+		"""Rescrape the specified races and update and re-predict those that have changed since the previous poll, returning the list of changed races"""
+
+		with recorder.measure('live_scrape'):
+			scraped = self.scrape(races)
+
+		changed = []
+		unlisted = []
+		for race, values in zip(races, scraped):
+			if values is None:
+				if race['_id'] not in self.unlisted:
+					unlisted.append(race)
+				continue
+
+			if race['_id'] not in self.fingerprints:
+				self.fingerprints[race['_id']] = self.get_fingerprint(race, race.runners)
+
+			fingerprint = self.get_fingerprint(*values)
+			if fingerprint != self.fingerprints[race['_id']]:
+				self.update_race(race, *values)
+				changed.append(race)
+			self.fingerprints[race['_id']] = fingerprint
+
+		logging.info('Detected changes to {changed} of {count} open races'.format(changed=len(changed), count=len(races)))
+
+		if len(unlisted) > 0:
+			self.remove_predictions(unlisted)
+		if len(changed) > 0:
+			self.repredict_races(changed)
+		return changed
+
+	def remove_predictions(self, races):
+		"""Delete the predictions for the specified races, which are no longer listed by their meets (e.g. because they have been abandoned)"""
+
+		self.flush_writes()
+
+		for race in races:
+			logging.warning('Race {number} at {track} is no longer listed, deleting its prediction'.format(number=race['number'], track=race.meet['track']))
+			self.unlisted.add(race['_id'])
+		Prediction.get_database_collection().delete_many({'race_id': {'$in': [race['_id'] for race in races]}})
+
+	def repredict_races(self, races):
+		"""Regenerate the seeds and predictions for the specified races and write their CSV rows
+
+		The races are reloaded from the database, so that their runners, seeds and predictions are loaded afresh rather than from the entities used for change detection.
+		"""
+
+		self.flush_writes()
+
+		Prediction.get_database_collection().delete_many({'race_id': {'$in': [race['_id'] for race in races]}})
+		for race in races:
+			Seed.handle_saved_race(race)
+		Seed.invalidate_stale()
+
+		races = [pyracing.Race.get_race_by_id(race['_id']) for race in races]
+
+		with recorder.measure('live_predict'):
+			for race, prediction in zip(races, Prediction.get_predictions_by_races(races)):
+				race.cache['prediction'] = prediction
+				self.post_process_race(race)
+
+		self.flush_writes()
+
+	def run(self, date_from, date_to):
+		"""Predict all races in the specified date range, then poll the open races for changes until all of them have started"""
+
+		self.process_dates(date_from, date_to)
+
+		races = self.get_open_races(date_from, date_to)
+		while len(races) > 0:
+			time.sleep(self.poll_interval)
+			races = self.get_open_races(date_from, date_to)
+			if len(races) > 0:
+				self.poll(races)
+
+	def scrape(self, races):
+		"""Return a list containing a tuple of the freshly scraped values and runners for each of the specified races, or None for races no longer listed by their meets"""
+
+		meets = OrderedDict()
+		for race in races:
+			meets.setdefault(race['meet_id'], race.meet)
+
+		with ThreadPoolExecutor(max_workers=self.live_threads) as executor:
+
+			race_values = {}
+			for meet_id, values in zip(meets, executor.map(self.scraper.scrape_races, meets.values())):
+				for value in values:
+					race_values[(meet_id, value['number'])] = value
+
+			def scrape_runners(race):
+				values = race_values.get((race['meet_id'], race['number']))
+				if values is not None:
+					return values, self.scraper.scrape_runners(race)
+
+			return list(executor.map(scrape_runners, races))
+
+	def update_race(self, race, values, runners):
+		"""Save the specified freshly scraped values and runners for the race, keeping the database IDs of existing runners so that their seeds are regenerated in place"""
+
+		race.update(values)
+		race.save()
+
+		existing = dict((runner['number'], runner) for runner in pyracing.Runner.find({'race_id': race['_id']}))
+		for values in runners:
+			runner = existing.pop(values['number'], None)
+			if runner is None:
+				runner = pyracing.Runner(values)
+			else:
+				runner.update(values)
+			runner['race_id'] = race['_id']
+			runner.save()
+
+		if len(existing) > 0:
+			removed_ids = [runner['_id'] for runner in existing.values()]
+			pyracing.Runner.get_database_collection().delete_many({'_id': {'$in': removed_ids}})
+			Seed.get_database_collection().delete_many({'runner_id': {'$in': removed_ids}})
+
+
+def main():
+	"""Main entry point for the live console script"""
+
+	locale.setlocale(locale.LC_ALL, '')
+
+	configuration = LiveProcessor.get_configuration(sys.argv[1:])
+
+	queued_csv_writer = QueuedCsvWriter(sys.stdout)
+	queued_csv_writer.writerow(LiveProcessor.CSV_HEADER)
+
+	processor = LiveProcessor(csv_writer=queued_csv_writer, **configuration)
+	try:
+		processor.run(date_from=configuration['date_from'], date_to=configuration['date_to'])
+	except KeyboardInterrupt:
+		pass
+	finally:
+		processor.flush_writes()
+
+	if queued_csv_writer.is_running:
+		queued_csv_writer.join()
+
+
+if __name__ == '__main__':
+	main()
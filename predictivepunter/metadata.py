@@ -0,0 +1,136 @@
+import threading
+
+import pymongo
+import pyracing
+
+try:
+	from .indexes import IndexRegistry
+except SystemError:
+	from indexes import IndexRegistry
+
+
+class Metadata:
+	"""Maintain global facts about the racing data in memory and in a metadata collection, updated incrementally as entities are saved"""
+
+	database = None
+
+	earliest_date = None
+	race_counts = {}
+	saved_races = {}
+	lock = threading.RLock()
+
+	@classmethod
+	def get_database_collection(cls):
+		"""Return the database collection in which metadata is stored"""
+
+		return cls.database['metadata']
+
+	@classmethod
+	def get_earliest_date(cls):
+		"""Return the earliest date for any meet in the database"""
+
+		if cls.earliest_date is None:
+			with cls.lock:
+				if cls.earliest_date is None:
+
+					document = cls.get_database_collection().find_one({'_id': 'earliest_date'})
+					if document is None:
+						document = {'_id': 'earliest_date', 'value': None}
+						for meet in pyracing.Meet.get_database_collection().find().sort('date').limit(1):
+							document['value'] = meet['date']
+						if document['value'] is not None:
+							cls.get_database_collection().update_one({'_id': 'earliest_date'}, {'$min': {'value': document['value']}}, upsert=True)
+
+					cls.earliest_date = document['value']
+
+		return cls.earliest_date
+
+	@classmethod
+	def get_race_count(cls, segment, date):
+		"""Return the number of races in the specified segment prior to the specified date"""
+
+		key = (segment, date)
+		if key not in cls.race_counts:
+
+			document = cls.get_database_collection().find_one({'type': 'race_count', 'segment': list(segment), 'date': date})
+			if document is None:
+				document = {
+					'type':		'race_count',
+					'segment':	list(segment),
+					'date':		date,
+					'value':	pyracing.Race.get_database_collection().count({
+						'entry_conditions':	list(segment[:-1]),
+						'track_condition':	segment[-1],
+						'start_time':		{'$lt': date}
+						})
+				}
+				cls.get_database_collection().replace_one({'type': 'race_count', 'segment': document['segment'], 'date': date}, document, upsert=True)
+
+			with cls.lock:
+				cls.race_counts[key] = document['value']
+
+		return cls.race_counts[key]
+
+	@classmethod
+	def handle_saved_meet(cls, meet):
+		"""Update the earliest date if the saved meet precedes it"""
+
+		if meet.get('date') is not None:
+			with cls.lock:
+				earliest_date = cls.get_earliest_date()
+				if earliest_date is None or meet['date'] < earliest_date:
+					cls.get_database_collection().update_one({'_id': 'earliest_date'}, {'$min': {'value': meet['date']}}, upsert=True)
+					cls.earliest_date = meet['date']
+
+	@classmethod
+	def handle_saved_race(cls, race):
+		"""Record the saved race's segment and start time so that the race counts that may include it can be discarded"""
+
+		if '_id' in race and race.get('entry_conditions') is not None and race.get('start_time') is not None:
+			segment = tuple(race['entry_conditions']) + tuple([race.get('track_condition')])
+			with cls.lock:
+				cls.saved_races.setdefault(race['_id'], []).append((segment, race['start_time']))
+
+	@classmethod
+	def invalidate_race_counts(cls):
+		"""Discard the race counts that may include the races saved since the last call
+
+		The segment each race was last saved in is stored in the metadata collection, so that when a race's segment changes (e.g. with its track condition), the counts for its previous segment are discarded as well as those for its new segment.
+		"""
+
+		with cls.lock:
+			saved_races = cls.saved_races
+			cls.saved_races = {}
+
+		if len(saved_races) > 0:
+			collection = cls.get_database_collection()
+
+			ids = dict(('race_segment:{id}'.format(id=race_id), race_id) for race_id in saved_races)
+			for document in collection.find({'_id': {'$in': list(ids.keys())}}):
+				saved_races[ids[document['_id']]].insert(0, (tuple(document['segment']), document['start_time']))
+
+			stale_segments = {}
+			for segments in saved_races.values():
+				for segment, start_time in segments:
+					stale_segments[segment] = min(stale_segments.get(segment, start_time), start_time)
+
+			with cls.lock:
+				for key in list(cls.race_counts.keys()):
+					if key[0] in stale_segments and key[1] > stale_segments[key[0]]:
+						del cls.race_counts[key]
+
+			collection.delete_many({'type': 'race_count', '$or': [{'segment': list(segment), 'date': {'$gt': start_time}} for segment, start_time in stale_segments.items()]})
+			collection.bulk_write([pymongo.ReplaceOne({'_id': id}, {'_id': id, 'segment': list(saved_races[race_id][-1][0]), 'start_time': saved_races[race_id][-1][1]}, upsert=True) for id, race_id in ids.items()], ordered=False)
+
+	@classmethod
+	def initialize(cls, database):
+		"""Initialize class dependencies"""
+
+		cls.database = database
+
+		with cls.lock:
+			cls.earliest_date = None
+			cls.race_counts = {}
+			cls.saved_races = {}
+
+		IndexRegistry.create_index(cls, [('type', 1), ('segment', 1), ('date', 1)])
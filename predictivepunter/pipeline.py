@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+import locale
+import sys
+import threading
+
+from jtgpy.threaded_queues import QueuedCsvWriter
+
+try:
+	from .instrumentation import recorder
+	from .predict import Prediction, PredictProcessor
+	from .seed import Seed
+except SystemError:
+	from instrumentation import recorder
+	from predict import Prediction, PredictProcessor
+	from seed import Seed
+
+
+class PipelineProcessor(PredictProcessor):
+	"""Scrape, seed and predict all races in the specified date range in a single traversal
+
+	The traversal scrapes each race's entities as the scrape processor does. As soon as a race has been traversed, it is queued for seeding and then for prediction in separate thread pools, while its runners, horses and performances are still in memory. Scraping of later races and meets therefore overlaps with the seeding and prediction of earlier ones. All queued races for a date are completed before the date is post-processed, so that predictors for the next date are trained on the seeds for all earlier dates.
+	"""
+
+	LONG_OPTIONS = [option for option in PredictProcessor.LONG_OPTIONS if option != 'batch-date'] + ['stage-threads=']
+
+	@classmethod
+	def get_default_configuration(cls):
+		"""Return a dictionary of the default configuration values, including those for the pipeline options"""
+
+		configuration = super().get_default_configuration()
+		configuration.update({
+			'stage_threads':	2
+		})
+		return configuration
+
+	@classmethod
+	def set_option(cls, configuration, opt, arg):
+		"""Update the configuration with the value for the specified command-line option, including the pipeline options"""
+
+		if opt == '--stage-threads':
+			configuration['stage_threads'] = int(arg)
+
+		else:
+			super().set_option(configuration, opt, arg)
+
+	def __init__(self, csv_writer, stage_threads=2, *args, **kwargs):
+		"""Initialize instance dependencies"""
+
+		super().__init__(csv_writer=csv_writer, message_prefix='pipelining', *args, **kwargs)
+
+		self.seed_executor = ThreadPoolExecutor(max_workers=stage_threads)
+		self.predict_executor = ThreadPoolExecutor(max_workers=stage_threads)
+
+		self.pending = []
+		self.pending_lock = threading.Lock()
+
+	def add_pending(self, future):
+		"""Record the specified future so that it is completed before the current date is post-processed"""
+
+		with self.pending_lock:
+			self.pending.append(future)
+
+	def predict_race(self, race):
+		"""Write the prediction for the specified race"""
+
+		with recorder.measure('pipeline_predict'):
+			super().post_process_race(race)
+
+	def pre_process_date(self, date):
+		"""Handle the pre_process_date event by clearing the predictor cache"""
+
+		Prediction.clear_predictor_cache()
+
+	def post_process_date(self, date):
+		"""Handle the post_process_date event by waiting for all races on the date to be seeded and predicted"""
+
+		while True:
+			with self.pending_lock:
+				pending = self.pending
+				self.pending = []
+			if len(pending) < 1:
+				break
+			for future in pending:
+				future.result()
+
+		super().post_process_date(date)
+
+	def post_process_race(self, race):
+		"""Handle the post_process_race event by queueing the race for seeding"""
+
+		self.add_pending(self.seed_executor.submit(self.seed_race, race))
+
+	def process_dates(self, date_from, date_to):
+		"""Process the date range, shutting down the stage thread pools on completion
+
+		In distributed mode, this method is called again by the lease coordinator for each date unit it claims, so the thread pools are only shut down on completion of the outermost call.
+		"""
+
+		try:
+			super().process_dates(date_from, date_to)
+		finally:
+			if self.lease_coordinator is None or not self.lease_coordinator.is_running:
+				self.seed_executor.shutdown()
+				self.predict_executor.shutdown()
+
+	def seed_race(self, race):
+		"""Generate and normalize the seeds for the specified race, then queue it for prediction"""
+
+		with recorder.measure('pipeline_seed'):
+			Seed.normalize_seeds(race.seeds)
+
+		self.add_pending(self.predict_executor.submit(self.predict_race, race))
+
+
+def main():
+	"""Main entry point for the pipeline console script"""
+
+	locale.setlocale(locale.LC_ALL, '')
+
+	configuration = PipelineProcessor.get_configuration(sys.argv[1:])
+
+	queued_csv_writer = QueuedCsvWriter(sys.stdout)
+	queued_csv_writer.writerow(PipelineProcessor.CSV_HEADER)
+
+	processor = PipelineProcessor(csv_writer=queued_csv_writer, **configuration)
+	processor.process_dates(date_from=configuration['date_from'], date_to=configuration['date_to'])
+
+	if queued_csv_writer.is_running:
+		queued_csv_writer.join()
+
+
+if __name__ == '__main__':
+	main()
@@ -1,20 +1,26 @@
 import locale
-import logging
 import sys
-import threading
-import time
 
 from jtgpy.threaded_queues import QueuedCsvWriter
 import numpy
 import pyracing
-from sklearn import cross_validation, feature_selection, linear_model, pipeline, svm, tree
 
 try:
+	from .cache import PredictorCache
 	from .common import CommandLineProcessor
+	from .indexes import IndexRegistry
+	from .instrumentation import recorder
+	from .metadata import Metadata
 	from .seed import Seed
+	from .store import ModelStore
 except SystemError:
+	from cache import PredictorCache
 	from common import CommandLineProcessor
+	from indexes import IndexRegistry
+	from instrumentation import recorder
+	from metadata import Metadata
 	from seed import Seed
+	from store import ModelStore
 
 
 class Prediction(pyracing.Entity):
@@ -23,18 +29,21 @@ class Prediction(pyracing.Entity):
 	PREDICTION_VERSION = 1
 	TEST_SIZE = 0.20
 
-	predictor_cache = {}
-	predictor_cache_lock = threading.RLock()
+	bulk_writer = None
+	candidate_history = None
+	estimator_executor = None
+	estimator_processes = 0
+	model_store = None
+	search_budget = None
+	write_concern = None
+
+	predictor_cache = PredictorCache()
 
 	@classmethod
 	def clear_predictor_cache(cls):
 		"""Remove all cached predictors"""
 
-		if isinstance(cls.predictor_cache, dict):
-			for key in cls.predictor_cache:
-				del cls.predictor_cache[key]
-		else:
-			cls.predictor_cache = {}
+		cls.predictor_cache.clear()
 
 	@classmethod
 	def delete_expired(cls, *args, **kwargs):
@@ -46,11 +55,20 @@ class Prediction(pyracing.Entity):
 			{'seed_version':		{'$lt': Seed.SEED_VERSION}}
 			]})
 
+	@classmethod
+	def get_database_collection(cls):
+		"""Return the predictions collection, configured with the write concern for derived data if one has been set"""
+
+		collection = super().get_database_collection()
+		if cls.write_concern is not None:
+			collection = collection.with_options(write_concern=cls.write_concern)
+		return collection
+
 	@classmethod
 	def get_earliest_date(cls):
 		"""Return the earliest date for any meet in the database"""
 
-		return pyracing.Meet.get_database_collection().find().sort('date')[0]['date']
+		return Metadata.get_earliest_date()
 
 	@classmethod
 	def get_prediction_by_id(cls, id):
@@ -62,167 +80,248 @@ class Prediction(pyracing.Entity):
 	def get_prediction_by_race(cls, race):
 		"""Get the prediction for the specified race"""
 
-		return cls.find_or_scrape_one(
-			filter={'race_id': race['_id'], 'earliest_date': cls.get_earliest_date(), 'prediction_version': cls.PREDICTION_VERSION, 'seed_version': Seed.SEED_VERSION},
-			scrape=cls.generate_prediction,
-			scrape_args=[race],
-			expiry_date=None
-			)
+		filter = {'race_id': race['_id'], 'earliest_date': cls.get_earliest_date(), 'prediction_version': cls.PREDICTION_VERSION, 'seed_version': Seed.SEED_VERSION}
+
+		if cls.bulk_writer is None:
+			return cls.find_or_scrape_one(
+				filter=filter,
+				scrape=cls.generate_prediction,
+				scrape_args=[race],
+				expiry_date=None
+				)
+
+		prediction = cls.bulk_writer.find_pending(cls, filter)
+		if prediction is None:
+			prediction = cls.find_one(filter)
+			if prediction is None:
+				prediction = cls(cls.generate_prediction(race))
+				prediction.save()
+		return prediction
+
+	@classmethod
+	def get_predictions_by_races(cls, races):
+		"""Get the predictions for all of the specified races, preferring any prediction pending in the bulk writer over the stored copy, and generating any missing predictions in a single batch"""
+
+		filter = {'earliest_date': cls.get_earliest_date(), 'prediction_version': cls.PREDICTION_VERSION, 'seed_version': Seed.SEED_VERSION}
+
+		predictions = {}
+		for prediction in cls.find(dict(filter, race_id={'$in': [race['_id'] for race in races]})):
+			predictions[prediction['race_id']] = prediction
+
+		if cls.bulk_writer is not None:
+			for race in races:
+				prediction = cls.bulk_writer.find_pending(cls, dict(filter, race_id=race['_id']))
+				if prediction is not None:
+					predictions[race['_id']] = prediction
+
+		missing_races = [race for race in races if race['_id'] not in predictions]
+		for race, prediction in zip(missing_races, cls.generate_predictions(missing_races)):
+			prediction = cls(prediction)
+			prediction.save()
+			predictions[race['_id']] = prediction
+
+		return [predictions[race['_id']] for race in races]
 
 	@classmethod
 	def generate_prediction(cls, race):
 		"""Generate a prediction for the specified race"""
 
-		prediction = {
-			'race_id':				race['_id'],
-			'earliest_date':		cls.get_earliest_date(),
-			'prediction_version':	cls.PREDICTION_VERSION,
-			'seed_version':			Seed.SEED_VERSION,
-			'results':				None,
-			'score':				None,
-			'train_seeds':			None,
-			'test_seeds':			None,
-			'estimator':			None
-		}
-
-		predictor = None
-		generate_predictor = False
-
-		segment = tuple(race['entry_conditions']) + tuple([race['track_condition']])
-		with cls.predictor_cache_lock:
-			if segment in cls.predictor_cache:
-				predictor = cls.predictor_cache[segment]
-			else:
-				cls.predictor_cache[segment] = None
-				generate_predictor = True
+		return cls.generate_predictions([race])[0]
 
-		if generate_predictor:
+	@classmethod
+	@recorder.measured('generate_prediction')
+	def generate_predictions(cls, races):
+		"""Generate predictions for all of the specified races, using a single predict call for all races that share a segment predictor"""
 
-			similar_races = pyracing.Race.find({
-				'entry_conditions': race['entry_conditions'],
-				'track_condition':	race['track_condition'],
-				'start_time':		{'$lt': race.meet['date']}
-				})
-			if len(similar_races) >= (1 / cls.TEST_SIZE):
-
-				try:
-
-					train_races, test_races = cross_validation.train_test_split(similar_races, test_size=cls.TEST_SIZE)
-
-					train_X = []
-					train_y = []
-					for train_race in train_races:
-						for seed in train_race.seeds:
-							if seed['result'] is not None:
-								train_X.append(seed.normalized_data)
-								train_y.append(seed['result'])
-
-					test_X = []
-					test_y = []
-					for test_race in test_races:
-						for seed in test_race.seeds:
-							if seed['result'] is not None:
-								test_X.append(seed.normalized_data)
-								test_y.append(seed['result'])
-
-					predictor = {
-						'classifier':	None,
-						'score':		None,
-						'train_seeds':	len(train_y),
-						'test_seeds':	len(test_y),
-						'estimator':	None
-					}
-					dual = len(train_X) < len(train_X[0])
-					kernel = 'linear'
-					loss = 'epsilon_insensitive'
-					if not dual:
-						loss = 'squared_epsilon_insensitive'
-					for estimator in (
-						linear_model.BayesianRidge(),
-						linear_model.ElasticNet(),
-						linear_model.LinearRegression(),
-						linear_model.LogisticRegression(),
-						linear_model.OrthogonalMatchingPursuit(),
-						linear_model.PassiveAggressiveRegressor(),
-						linear_model.Perceptron(),
-						linear_model.Ridge(),
-						linear_model.SGDRegressor(),
-						svm.SVR(kernel=kernel),
-						svm.LinearSVR(dual=dual, loss=loss),
-						svm.NuSVR(kernel=kernel),
-						tree.DecisionTreeRegressor(),
-						tree.ExtraTreeRegressor()
-						):
-						logging.debug('Trying {estimator} for {segment}'.format(estimator=estimator.__class__.__name__, segment=segment))
-
-						try:
-							classifier = pipeline.Pipeline([
-								('feature_selection', feature_selection.SelectFromModel(estimator, 'mean')),
-								('regression', estimator)
-								])
-							classifier.fit(train_X, train_y)
-							score = classifier.score(test_X, test_y)
-
-							if predictor['classifier'] is None or predictor['score'] is None or score > predictor['score']:
-								logging.debug('Using {estimator} ({score}) for {segment}'.format(estimator=estimator.__class__.__name__, score=score, segment=segment))
-								predictor['classifier'] = classifier
-								predictor['score'] = score
-								predictor['estimator'] = estimator.__class__.__name__
-
-						except BaseException as e:
-							logging.debug('Caught exception while trying {estimator} for {segment}: {exception}'.format(estimator=estimator.__class__.__name__, segment=segment, exception=e))
-							continue
-
-					cls.predictor_cache[segment] = predictor
-
-				except:
-
-					del cls.predictor_cache[segment]
-					raise
-
-			else:
-
-				del cls.predictor_cache[segment]
+		groups = {}
+		for race in races:
+			key = (cls.get_segment(race), race.meet['date'])
+			if key not in groups:
+				groups[key] = []
+			groups[key].append(race)
 
-		else:
+		predictions = {}
+		for key in groups:
+			predictor = cls.get_predictor(groups[key][0])
+			for race, prediction in zip(groups[key], cls.predict_races(predictor, groups[key])):
+				predictions[race['_id']] = prediction
 
-			while predictor is None:
-				try:
-					predictor = cls.predictor_cache[segment]
-					time.sleep(10)
-				except KeyError:
-					break
+		return [predictions[race['_id']] for race in races]
+
+	@classmethod
+	def predict_races(cls, predictor, races):
+		"""Return a list of predictions for the specified races using the specified predictor, with the seeds for all races predicted in a single call"""
+
+		earliest_date = cls.get_earliest_date()
+		predictions = []
+		for race in races:
+			predictions.append({
+				'race_id':				race['_id'],
+				'earliest_date':		earliest_date,
+				'prediction_version':	cls.PREDICTION_VERSION,
+				'seed_version':			Seed.SEED_VERSION,
+				'results':				None,
+				'score':				None,
+				'train_seeds':			None,
+				'test_seeds':			None,
+				'estimator':			None
+			})
 
 		if predictor is not None:
 
 			reverse = False
 			if 'score' in predictor and predictor['score'] is not None:
 				reverse = predictor['score'] < 0
-				prediction['score'] = abs(predictor['score'])
+				for prediction in predictions:
+					prediction['score'] = abs(predictor['score'])
 
 			if 'classifier' in predictor and predictor['classifier'] is not None:
-				raw_results = {}
-				for seed in race.seeds:
-					raw_result = predictor['classifier'].predict(numpy.array(seed.normalized_data).reshape(1, -1))[0]
-					if raw_result is not None:
-						if not raw_result in raw_results:
-							raw_results[raw_result] = []
-						raw_results[raw_result].append(seed.runner['number'])
-				for key in sorted(raw_results.keys(), reverse=reverse):
-					if prediction['results'] is None:
-						prediction['results'] = []
-					prediction['results'].append(sorted([number for number in raw_results[key]]))
-
-			if 'train_seeds' in predictor:
-				prediction['train_seeds'] = predictor['train_seeds']
-
-			if 'test_seeds' in predictor:
-				prediction['test_seeds'] = predictor['test_seeds']
-
-			if 'estimator' in predictor:
-				prediction['estimator'] = predictor['estimator']
-		
-		return prediction
+
+				race_seeds = []
+				for race in races:
+					seeds = [seed for seed in race.seeds if seed is not None]
+					Seed.normalize_seeds(seeds)
+					race_seeds.append(seeds)
+
+				rows = [seed.normalized_data for seeds in race_seeds for seed in seeds]
+				if len(rows) > 0:
+					raw_values = predictor['classifier'].predict(numpy.array(rows))
+
+					offset = 0
+					for prediction, seeds in zip(predictions, race_seeds):
+						raw_results = {}
+						for seed, raw_result in zip(seeds, raw_values[offset:offset + len(seeds)]):
+							if raw_result is not None:
+								if not raw_result in raw_results:
+									raw_results[raw_result] = []
+								raw_results[raw_result].append(seed.runner['number'])
+						offset += len(seeds)
+
+						for key in sorted(raw_results.keys(), reverse=reverse):
+							if prediction['results'] is None:
+								prediction['results'] = []
+							prediction['results'].append(sorted([number for number in raw_results[key]]))
+
+			for key in ('train_seeds', 'test_seeds', 'estimator'):
+				if key in predictor:
+					for prediction in predictions:
+						prediction[key] = predictor[key]
+
+		return predictions
+
+	@classmethod
+	def find_or_generate_predictor(cls, segment, date):
+		"""Return a stored predictor for the specified segment if it is still valid for the specified date, otherwise generate and store a new one"""
+
+		if cls.model_store is None:
+			return cls.generate_predictor(segment, date)
+
+		race_count = Metadata.get_race_count(segment, date)
+
+		predictor = cls.model_store.load(segment, date, race_count)
+		if predictor is None:
+			predictor = cls.generate_predictor(segment, date)
+			if predictor is not None:
+				cls.model_store.save(segment, date, race_count, predictor)
+
+		return predictor
+
+	@classmethod
+	@recorder.measured('generate_predictor')
+	def generate_predictor(cls, segment, date):
+		"""Train a predictor for the specified segment using all similar races prior to the specified date, or return None if there are insufficient similar races"""
+
+		similar_races = [pyracing.Race(race) for race in Seed.get_training_collection(pyracing.Race).find(cls.get_segment_filter(segment, date))]
+		if len(similar_races) >= (1 / cls.TEST_SIZE):
+
+			from sklearn import cross_validation
+			try:
+				from .estimators import select_estimator
+			except SystemError:
+				from estimators import select_estimator
+
+			train_races, test_races = cross_validation.train_test_split(similar_races, test_size=cls.TEST_SIZE)
+
+			train_X, train_y = Seed.get_training_data(train_races)
+			test_X, test_y = Seed.get_training_data(test_races)
+
+			classifier, score, estimator = select_estimator(train_X, train_y, test_X, test_y, segment, executor=cls.estimator_executor, budget=cls.search_budget, history=cls.candidate_history)
+
+			predictor = {
+				'classifier':	classifier,
+				'score':		score,
+				'train_seeds':	len(train_y),
+				'test_seeds':	len(test_y),
+				'estimator':	estimator
+			}
+
+			return predictor
+
+	@classmethod
+	def get_predictor(cls, race, date=None):
+		"""Return the predictor for the specified race's segment trained on races prior to the specified date (or the race's date), generating and caching it if necessary
+
+		The first thread to request a segment and date loads its predictor from the cache's spill directory or trains it, while any other threads requesting the same segment and date wait on a future that is resolved as soon as loading or training completes or fails.
+		"""
+
+		segment = cls.get_segment(race)
+		if date is None:
+			date = race.meet['date']
+		key = (segment, date)
+
+		future, generate_predictor = cls.predictor_cache.get_or_create(key)
+
+		if generate_predictor:
+
+			try:
+				predictor = cls.predictor_cache.load_spilled(key)
+				if predictor is None:
+					predictor = cls.find_or_generate_predictor(segment, date)
+			except BaseException as e:
+				cls.predictor_cache.discard(key, future)
+				future.set_exception(e)
+				raise
+
+			if predictor is None:
+				cls.predictor_cache.discard(key, future)
+			cls.predictor_cache.set_result(key, future, predictor)
+
+		return future.result()
+
+	@classmethod
+	def get_segment(cls, race):
+		"""Return a tuple identifying the segment of similar races to which the specified race belongs"""
+
+		return tuple(race['entry_conditions']) + tuple([race['track_condition']])
+
+	@classmethod
+	def get_segment_filter(cls, segment, date):
+		"""Return a database filter for all races in the specified segment prior to the specified date"""
+
+		return {
+			'entry_conditions':	list(segment[:-1]),
+			'track_condition':	segment[-1],
+			'start_time':		{'$lt': date}
+			}
+
+	@classmethod
+	def set_estimator_processes(cls, processes):
+		"""Keep the shared estimator process pool if it already has the specified number of processes, otherwise shut it down and replace it (with no pool if processes is 0)"""
+
+		if cls.estimator_executor is not None and cls.estimator_processes == processes:
+			return
+
+		if cls.estimator_executor is not None:
+			cls.estimator_executor.shutdown()
+
+		cls.estimator_executor = None
+		cls.estimator_processes = processes
+		if processes > 0:
+			try:
+				from .estimators import EstimatorPool
+			except SystemError:
+				from estimators import EstimatorPool
+			cls.estimator_executor = EstimatorPool(processes)
 
 	@classmethod
 	def initialize(cls):
@@ -234,9 +333,9 @@ class Prediction(pyracing.Entity):
 
 		cls.event_manager.add_subscriber('deleting_race', handle_deleting_race)
 
-		cls.create_index([('race_id', 1), ('earliest_date', 1), ('prediction_version', 1), ('seed_version', 1)])
+		IndexRegistry.create_index(cls, [('race_id', 1), ('earliest_date', 1), ('prediction_version', 1), ('seed_version', 1)])
 
-		pyracing.Race.create_index([('entry_conditions', 1), ('track_condition', 1), ('start_time', -1)])
+		IndexRegistry.create_index(pyracing.Race, [('entry_conditions', 1), ('track_condition', 1), ('start_time', -1)])
 
 		@property
 		def prediction(self):
@@ -252,6 +351,14 @@ class Prediction(pyracing.Entity):
 
 		return 'prediction for race {race}'.format(race=self.race)
 
+	def save(self):
+		"""Save the prediction via the bulk writer if one has been configured"""
+
+		if Prediction.bulk_writer is not None:
+			Prediction.bulk_writer.save(self)
+		else:
+			super().save()
+
 	@property
 	def confidence(self):
 		"""Return the prediction score multiplied by the number of test seeds"""
@@ -260,6 +367,21 @@ class Prediction(pyracing.Entity):
 			if 'test_seeds' in self and self['test_seeds'] is not None:
 				return self['score'] * self['test_seeds']
 
+	@property
+	def picks(self):
+		"""Return a list of the runner numbers predicted to finish 1st to 4th, where each pick is a list of tied runner numbers placed at the position of the first of them, or None"""
+
+		picks = [None for pick_count in range(4)]
+		if 'results' in self and self['results'] is not None:
+			total_picks = 0
+			for result in self['results']:
+				if total_picks < 4:
+					picks[total_picks] = result
+					total_picks += len(result)
+				else:
+					break
+		return picks
+
 	@property
 	def race(self):
 		"""Return the race to which this prediction applies"""
@@ -272,40 +394,124 @@ class Prediction(pyracing.Entity):
 class PredictProcessor(CommandLineProcessor):
 	"""Populate the database with predictions for all runners in the specified date range"""
 
-	def __init__(self, csv_writer, *args, **kwargs):
+	ACKNOWLEDGE_DERIVED_WRITES = True
+
+	CSV_HEADER = [
+		'Date',
+		'Track',
+		'Race',
+		'Start Time',
+		'1st',
+		'2nd',
+		'3rd',
+		'4th',
+		'Confidence',
+		'Estimator'
+		]
+
+	LONG_OPTIONS = CommandLineProcessor.LONG_OPTIONS + ['model-store=', 'retrain-days=', 'retrain-races=', 'estimator-processes=', 'search-budget=', 'skip-after=', 'batch-date', 'predictor-cache-size=', 'predictor-cache-policy=', 'predictor-spill=']
+
+	@classmethod
+	def get_default_configuration(cls):
+		"""Return a dictionary of the default configuration values, including those for the prediction options"""
+
+		configuration = super().get_default_configuration()
+		configuration.update({
+			'batch_date':		False,
+			'estimator_processes':	0,
+			'model_store':		None,
+			'predictor_cache_policy':	'lru',
+			'predictor_cache_size':	0,
+			'predictor_spill':	None,
+			'retrain_days':		7,
+			'retrain_races':	0,
+			'search_budget':	0,
+			'skip_after':		3
+		})
+		return configuration
+
+	@classmethod
+	def set_option(cls, configuration, opt, arg):
+		"""Update the configuration with the value for the specified command-line option, including the prediction options"""
+
+		if opt == '--model-store':
+			configuration['model_store'] = arg
+
+		elif opt == '--retrain-days':
+			configuration['retrain_days'] = int(arg)
+
+		elif opt == '--retrain-races':
+			configuration['retrain_races'] = int(arg)
+
+		elif opt == '--estimator-processes':
+			configuration['estimator_processes'] = int(arg)
+
+		elif opt == '--search-budget':
+			configuration['search_budget'] = int(arg)
+
+		elif opt == '--skip-after':
+			configuration['skip_after'] = int(arg)
+
+		elif opt == '--batch-date':
+			configuration['batch_date'] = True
+
+		elif opt == '--predictor-cache-size':
+			configuration['predictor_cache_size'] = int(arg) * 1024 * 1024
+
+		elif opt == '--predictor-cache-policy':
+			configuration['predictor_cache_policy'] = arg
+
+		elif opt == '--predictor-spill':
+			configuration['predictor_spill'] = arg
+
+		else:
+			super().set_option(configuration, opt, arg)
+
+	def __init__(self, csv_writer, batch_date=False, estimator_processes=0, message_prefix='predicting', model_store=None, predictor_cache_policy='lru', predictor_cache_size=0, predictor_spill=None, retrain_days=7, retrain_races=0, search_budget=0, skip_after=3, *args, **kwargs):
 		"""Initialize instance dependencies"""
 
-		super().__init__(message_prefix='predicting', *args, **kwargs)
+		super().__init__(message_prefix=message_prefix, *args, **kwargs)
 
 		self.csv_writer = csv_writer
+		self.batch_date = batch_date
+
+		Prediction.predictor_cache = PredictorCache(size_limit=predictor_cache_size, spill_directory=predictor_spill, policy=predictor_cache_policy)
+
+		Prediction.set_estimator_processes(estimator_processes)
+
+		Prediction.search_budget = Prediction.candidate_history = None
+		if search_budget > 0:
+			try:
+				from .estimators import CandidateHistory
+			except SystemError:
+				from estimators import CandidateHistory
+			Prediction.search_budget = search_budget
+			Prediction.candidate_history = CandidateHistory(skip_after=skip_after)
+
+		Prediction.model_store = None
+		if model_store is not None:
+			Prediction.model_store = ModelStore(model_store, Prediction.PREDICTION_VERSION, Seed.SEED_VERSION, retrain_days=retrain_days, retrain_races=retrain_races)
 
 	def pre_process_date(self, date):
-		"""Handle the pre_process_date event by clearing the predictor cache"""
+		"""Handle the pre_process_date event by clearing the predictor cache, and generating predictions for all races on the date in segment batches if required"""
 
 		Prediction.clear_predictor_cache()
 
-	def post_process_race(self, race):
-		"""Handle the post_process_race event by creating a prediction for the race"""
-		
+		if self.batch_date:
+			Prediction.get_predictions_by_races([race for meet in pyracing.Meet.get_meets_by_date(date) for race in meet.races])
+
+	def get_row(self, race):
+		"""Return a list of CSV values for the specified race's prediction, or None if the race has no prediction"""
+
 		if race.prediction is not None:
 
-			picks = [None for pick_count in range(4)]
-			if 'results' in race.prediction and race.prediction['results'] is not None:
-				total_picks = 0
-				for result in race.prediction['results']:
-					if total_picks < 4:
-						picks[total_picks] = result
-						total_picks += len(result)
-					else:
-						break
-			
 			row = [
 				race.meet['date'].date(),
 				race.meet['track'],
 				race['number'],
 				race['start_time'].time()
 				]
-			for pick in picks:
+			for pick in race.prediction.picks:
 				if pick is None or len(pick) < 1:
 					row.append(None)
 				else:
@@ -313,7 +519,15 @@ class PredictProcessor(CommandLineProcessor):
 			row.append(race.prediction.confidence)
 			row.append(race.prediction['estimator'])
 
-			self.csv_writer.writerow(row)
+			return row
+
+	def post_process_race(self, race):
+		"""Handle the post_process_race event by creating a prediction for the race"""
+
+		row = self.get_row(race)
+		if row is not None:
+			with recorder.measure('csv_output'):
+				self.csv_writer.writerow(row)
 
 
 def main():
@@ -324,18 +538,7 @@ def main():
 	configuration = PredictProcessor.get_configuration(sys.argv[1:])
 
 	queued_csv_writer = QueuedCsvWriter(sys.stdout)
-	queued_csv_writer.writerow([
-		'Date',
-		'Track',
-		'Race',
-		'Start Time',
-		'1st',
-		'2nd',
-		'3rd',
-		'4th',
-		'Confidence',
-		'Estimator'
-		])
+	queued_csv_writer.writerow(PredictProcessor.CSV_HEADER)
 
 	processor = PredictProcessor(csv_writer=queued_csv_writer, **configuration)
 	processor.process_dates(date_from=configuration['date_from'], date_to=configuration['date_to'])
@@ -1,25 +1,107 @@
+from datetime import datetime
+import hashlib
 import locale
+import logging
 import sys
+import threading
 
+from bson import Binary
+import numpy
+import pymongo
 import pyracing
 
 try:
 	from .common import CommandLineProcessor
+	from .indexes import IndexRegistry
+	from .instrumentation import recorder
+	from .metadata import Metadata
 except SystemError:
 	from common import CommandLineProcessor
+	from indexes import IndexRegistry
+	from instrumentation import recorder
+	from metadata import Metadata
 
 
 class Seed(pyracing.Entity):
 	"""A seed represents a runner's data in a consistent format applicable to machine learning"""
 
 	SEED_VERSION = 4
+	PACKED_KEYS = ('raw_data', 'normalized_data')
+
+	bulk_writer = None
+	compact_dtype = None
+	training_read_preference = None
+	write_concern = None
+
+	stale_races = {}
+	saved_performances = []
+	stale_lock = threading.RLock()
 
 	@classmethod
 	def delete_expired(cls, *args, **kwargs):
-		"""Delete outdated seeds"""
+		"""Delete outdated seeds, and convert current seeds stored in a format other than the configured one
+
+		Once all seeds have been converted, the seed version and dtype are stored as a seed_format marker in the metadata collection, so that the seeds are only scanned again when either of them changes.
+		"""
+
+		marker = {'_id': 'seed_format', 'seed_version': cls.SEED_VERSION, 'dtype': cls.compact_dtype}
+		if Metadata.get_database_collection().find_one(marker) is not None:
+			return
 
 		cls.get_database_collection().delete_many({'seed_version': {'$lt': cls.SEED_VERSION}})
 
+		filter = {'seed_version': cls.SEED_VERSION, '$or': [{key: {'$exists': True}} for key in cls.PACKED_KEYS] + [{'packed_' + key + '.dtype': {'$exists': True, '$ne': cls.compact_dtype}} for key in cls.PACKED_KEYS]}
+		if cls.compact_dtype is None:
+			filter['$or'] = [{'packed_' + key: {'$exists': True}} for key in cls.PACKED_KEYS]
+
+		requests = []
+		for document in cls.get_database_collection().find(filter):
+			seed = cls(document)
+			updates = {'$set': {}, '$unset': {}}
+			for key in cls.PACKED_KEYS:
+				if key in seed:
+					if cls.compact_dtype is None:
+						updates['$set'][key] = seed[key]
+						updates['$unset']['packed_' + key] = ''
+					else:
+						updates['$set']['packed_' + key] = cls.pack_values(seed[key], cls.compact_dtype)
+						updates['$unset'][key] = ''
+			requests.append(pymongo.UpdateOne({'_id': seed['_id']}, dict((operator, fields) for operator, fields in updates.items() if len(fields) > 0)))
+
+			if len(requests) >= 1000:
+				cls.get_database_collection().bulk_write(requests, ordered=False)
+				requests = []
+
+		if len(requests) > 0:
+			cls.get_database_collection().bulk_write(requests, ordered=False)
+
+		Metadata.get_database_collection().replace_one({'_id': 'seed_format'}, marker, upsert=True)
+
+	@classmethod
+	def set_compact_dtype(cls, dtype):
+		"""Set the dtype in which seed data is packed, or None to store it unpacked, discarding the seed_format marker if it records a different format so that the next call to delete_expired converts any seeds saved in the new format"""
+
+		cls.compact_dtype = dtype
+		Metadata.get_database_collection().delete_one({'_id': 'seed_format', '$or': [{'seed_version': {'$ne': cls.SEED_VERSION}}, {'dtype': {'$ne': dtype}}]})
+
+	@classmethod
+	def get_database_collection(cls):
+		"""Return the seeds collection, configured with the write concern for derived data if one has been set"""
+
+		collection = super().get_database_collection()
+		if cls.write_concern is not None:
+			collection = collection.with_options(write_concern=cls.write_concern)
+		return collection
+
+	@classmethod
+	def get_training_collection(cls, entity_class):
+		"""Return the database collection for the specified entity class, configured with the read preference for training queries if one has been set"""
+
+		collection = entity_class.get_database_collection()
+		if cls.training_read_preference is not None:
+			collection = collection.with_options(read_preference=cls.training_read_preference)
+		return collection
+
 	@classmethod
 	def get_seed_by_id(cls, id):
 		"""Get the single seed with the specified database ID"""
@@ -30,14 +112,33 @@ class Seed(pyracing.Entity):
 	def get_seed_by_runner(cls, runner):
 		"""Get the seed for the specified runner"""
 
-		return cls.find_or_scrape_one(
-			filter={'runner_id': runner['_id'], 'seed_version': cls.SEED_VERSION},
-			scrape=cls.generate_seed,
-			scrape_args=[runner],
-			expiry_date=None
-			)
+		filter = {'runner_id': runner['_id'], 'seed_version': cls.SEED_VERSION}
+
+		if cls.bulk_writer is None:
+			seed = cls.find_or_scrape_one(
+				filter=filter,
+				scrape=cls.generate_seed,
+				scrape_args=[runner],
+				expiry_date=None
+				)
+
+		else:
+			seed = cls.bulk_writer.find_pending(cls, filter)
+			if seed is None:
+				seed = cls.find_one(filter)
+				if seed is None:
+					seed = cls(cls.generate_seed(runner))
+					seed.save()
+
+		if seed is not None and seed.get('stale', False):
+			for race_seed in cls.get_seeds_by_race(runner.race):
+				if race_seed['runner_id'] == runner['_id']:
+					return race_seed
+
+		return seed
 
 	@classmethod
+	@recorder.measured('generate_seed')
 	def generate_seed(cls, runner):
 		"""Generate a seed for the specified runner"""
 		
@@ -63,6 +164,326 @@ class Seed(pyracing.Entity):
 
 		return seed
 
+	@classmethod
+	@recorder.measured('generate_seeds')
+	def get_seeds_by_race(cls, race):
+		"""Get the seeds for all runners in the specified race
+
+		Existing seeds are loaded in a single query, with any seed pending in the bulk writer taking precedence over the stored copy. If any seeds are missing or stale, the horses, jockeys and performances for the race's runners are loaded in bulk via prime_runners before those seeds are generated, so that seed generation does not query the database separately for each runner. Stale seeds are regenerated in place, after which the normalized data for all seeds in the race is recalculated.
+		"""
+
+		runners = race.runners
+		stored = {}
+		for seed in cls.get_database_collection().find({'runner_id': {'$in': [runner['_id'] for runner in runners]}, 'seed_version': cls.SEED_VERSION}):
+			stored[seed['runner_id']] = cls(seed)
+
+		seeds = {}
+		missing = []
+		stale = False
+		for runner in runners:
+			seed = None
+			if cls.bulk_writer is not None:
+				seed = cls.bulk_writer.find_pending(cls, {'runner_id': runner['_id'], 'seed_version': cls.SEED_VERSION})
+			if seed is None:
+				seed = stored.get(runner['_id'])
+
+			if seed is None:
+				missing.append(runner)
+			else:
+				seeds[runner['_id']] = seed
+				if seed.get('stale', False):
+					missing.append(runner)
+					stale = True
+
+		if len(missing) > 0:
+			cls.prime_runners(race, missing)
+			for runner in missing:
+				seed = cls(cls.generate_seed(runner))
+				if runner['_id'] in seeds:
+					seed['_id'] = seeds[runner['_id']]['_id']
+					seed['stale'] = False
+				seed.save()
+				seeds[runner['_id']] = seed
+
+		race_seeds = [seeds[runner['_id']] for runner in runners]
+
+		if stale:
+			normalized = cls.normalize_raw_data([seed.raw_array for seed in race_seeds])
+			for index, seed in enumerate(race_seeds):
+				seed['normalized_data'] = normalized[index].tolist()
+				seed['stale'] = False
+				seed.save()
+
+		return race_seeds
+
+	@classmethod
+	def create_primed_property(cls, original, key):
+		"""Return a property that returns the value provided by prime_runners under the specified cache key if there is one, or otherwise the value of the specified pyracing property"""
+
+		if getattr(original.fget, 'is_primed', False):
+			return original
+
+		def get_value(self):
+			if key in self.cache:
+				return self.cache[key]
+			return original.fget(self)
+
+		get_value.is_primed = True
+		return property(get_value, doc=original.__doc__)
+
+	@classmethod
+	def prime_runners(cls, race, runners):
+		"""Load the race, horses, jockeys and performances for the specified runners in bulk and attach them to the runners
+
+		Only the performances up to the race's start time are loaded, as no later performances contribute to the race's seeds. They are provided to seed generation, along with the race, horses and jockeys, via the properties installed by initialize. A horse or jockey is only primed if it was last saved after the race started, so that its stored performances are known to include all of those prior to the race. All other horses and jockeys load their performances through pyracing as before, including any scraping that pyracing deems necessary.
+		"""
+
+		horse_urls = list(set(runner['horse_url'] for runner in runners if runner.get('horse_url') is not None))
+		jockey_urls = list(set(runner['jockey_url'] for runner in runners if runner.get('jockey_url') is not None))
+
+		horses = dict((horse['url'], pyracing.Horse(horse)) for horse in pyracing.Horse.get_database_collection().find({'url': {'$in': horse_urls}}))
+		jockeys = dict((jockey['url'], pyracing.Jockey(jockey)) for jockey in pyracing.Jockey.get_database_collection().find({'url': {'$in': jockey_urls}}))
+
+		for entities, key in ((horses, 'horse_url'), (jockeys, 'jockey_url')):
+			urls = [url for url, entity in entities.items() if entity.get('updated_at') is not None and entity['updated_at'] >= race['start_time']]
+			if len(urls) > 0:
+				performances = dict((url, []) for url in urls)
+				for performance in pyracing.Performance.get_database_collection().find({key: {'$in': urls}, 'date': {'$lte': race['start_time']}}):
+					performances[performance[key]].append(pyracing.Performance(performance))
+				for url in urls:
+					entities[url].cache['primed_performances'] = performances[url]
+
+		for runner in runners:
+			runner.cache.setdefault('primed_race', race)
+			if runner.get('horse_url') in horses:
+				runner.cache.setdefault('primed_horse', horses[runner['horse_url']])
+			if runner.get('jockey_url') in jockeys:
+				runner.cache.setdefault('primed_jockey', jockeys[runner['jockey_url']])
+
+	@classmethod
+	def pack_values(cls, values, dtype='float32'):
+		"""Return a dictionary containing the specified list of values packed into a binary array of the specified dtype, with a separate bitmask of None values"""
+
+		nulls = numpy.array([value is None for value in values], dtype=bool)
+		array = numpy.array([numpy.nan if value is None else value for value in values], dtype=dtype)
+
+		return {
+			'dtype':	dtype,
+			'length':	len(values),
+			'values':	Binary(array.tobytes()),
+			'nulls':	Binary(numpy.packbits(nulls).tobytes())
+		}
+
+	@classmethod
+	def unpack_array(cls, packed):
+		"""Return a read-only NumPy array backed directly by the packed values, with None values represented as NaN"""
+
+		return numpy.frombuffer(packed['values'], dtype=packed['dtype'], count=packed['length'])
+
+	@classmethod
+	def unpack_values(cls, packed):
+		"""Return a list of the packed values, with None values restored"""
+
+		nulls = numpy.unpackbits(numpy.frombuffer(packed['nulls'], dtype=numpy.uint8))[:packed['length']]
+		return [None if is_null else value for value, is_null in zip(cls.unpack_array(packed).tolist(), nulls)]
+
+	@classmethod
+	def normalize_raw_data(cls, raw_data):
+		"""Return a runners x features matrix of the raw data values normalized column-wise across all rows
+
+		None values are treated as missing, and are replaced with the normalized mean of the other values in the same column. Columns with fewer than two distinct values are normalized to 0.5.
+		"""
+
+		values = numpy.array(raw_data, dtype=float)
+		if values.ndim != 2:
+			values = values.reshape(len(raw_data), -1)
+
+		missing = numpy.isnan(values)
+		present = ~missing
+		counts = present.sum(axis=0)
+
+		minimums = numpy.where(present, values, numpy.inf).min(axis=0)
+		maximums = numpy.where(present, values, -numpy.inf).max(axis=0)
+		means = numpy.where(present, values, 0.0).sum(axis=0) / numpy.maximum(counts, 1)
+
+		ranges = maximums - minimums
+		valid = (counts > 0) & (ranges > 0)
+		safe_ranges = numpy.where(valid, ranges, 1.0)
+		safe_minimums = numpy.where(valid, minimums, 0.0)
+
+		filled = numpy.where(missing, means, values)
+		return numpy.where(valid, (filled - safe_minimums) / safe_ranges, 0.5)
+
+	@classmethod
+	@recorder.measured('normalize_seeds')
+	def normalize_seeds(cls, seeds):
+		"""Normalize the raw data for all of the specified seeds (usually all seeds for a single race) in a single pass, saving any seeds that were not previously normalized"""
+
+		seeds = [seed for seed in seeds if seed is not None]
+		if len(seeds) < 1:
+			return
+
+		normalized = cls.normalize_raw_data([seed.raw_array for seed in seeds])
+
+		for index, seed in enumerate(seeds):
+			if not 'normalized_data' in seed:
+				seed['normalized_data'] = normalized[index].tolist()
+				seed.save()
+
+	@classmethod
+	@recorder.measured('get_training_data')
+	def get_training_data(cls, races):
+		"""Return NumPy arrays of the normalized data (X) and results (y) for all seeds with results in the specified races
+
+		Existing seeds for all runners in the races are loaded in a single query, with any seed pending in the bulk writer taking precedence over the stored copy, while seeds for races with missing or stale seeds are generated in bulk via the race's seeds property.
+		"""
+
+		race_runner_ids = dict((race['_id'], []) for race in races)
+		for runner in cls.get_training_collection(pyracing.Runner).find({'race_id': {'$in': list(race_runner_ids.keys())}}, {'_id': 1, 'race_id': 1}):
+			race_runner_ids[runner['race_id']].append(runner['_id'])
+
+		seeds = {}
+		for seed in cls.get_training_collection(cls).find({'runner_id': {'$in': [runner_id for runner_ids in race_runner_ids.values() for runner_id in runner_ids]}, 'seed_version': cls.SEED_VERSION, 'stale': {'$ne': True}}):
+			seeds[seed['runner_id']] = cls(seed)
+
+		if cls.bulk_writer is not None:
+			for runner_ids in race_runner_ids.values():
+				for runner_id in runner_ids:
+					seed = cls.bulk_writer.find_pending(cls, {'runner_id': runner_id, 'seed_version': cls.SEED_VERSION})
+					if seed is not None:
+						if seed.get('stale', False):
+							seeds.pop(runner_id, None)
+						else:
+							seeds[runner_id] = seed
+
+		X = []
+		y = []
+		for race in races:
+			race_seeds = [seeds.get(runner_id) for runner_id in race_runner_ids[race['_id']]]
+			if len(race_seeds) < 1 or None in race_seeds:
+				race_seeds = [seed for seed in race.seeds if seed is not None]
+
+			cls.normalize_seeds(race_seeds)
+			for seed in race_seeds:
+				if seed['result'] is not None:
+					X.append(seed.normalized_array)
+					y.append(seed['result'])
+
+		return numpy.array(X, dtype=float), numpy.array(y)
+
+	@classmethod
+	def get_changed_performances(cls, performances):
+		"""Return the subset of the specified saved performances that are new or whose values differ from those previously saved, recording their digests for subsequent calls
+
+		A digest of each performance's values is stored in the performance_digests collection, keyed by the performance's horse and date, so that unchanged performances re-saved by a rescrape can be distinguished from new or corrected ones even if the performance documents themselves are replaced.
+		"""
+
+		digests = {}
+		for performance in performances:
+			digests['{horse_url}:{date}'.format(horse_url=performance['horse_url'], date=performance['date'].strftime('%Y%m%d'))] = performance
+
+		collection = cls.get_digest_collection()
+		stored = dict((document['_id'], document['digest']) for document in collection.find({'_id': {'$in': list(digests.keys())}}))
+
+		changed = []
+		requests = []
+		for id, performance in digests.items():
+			if stored.get(id) != performance['digest']:
+				changed.append(performance)
+				requests.append(pymongo.ReplaceOne({'_id': id}, {'_id': id, 'digest': performance['digest']}, upsert=True))
+		if len(requests) > 0:
+			collection.bulk_write(requests, ordered=False)
+
+		return changed
+
+	@classmethod
+	def get_digest_collection(cls):
+		"""Return the database collection in which performance digests are stored"""
+
+		return pyracing.Performance.get_database_collection().database['performance_digests']
+
+	@classmethod
+	def get_performance_digest(cls, performance):
+		"""Return a digest of the specified performance's values, excluding its database ID and timestamps"""
+
+		values = sorted((key, value) for key, value in performance.items() if key not in ('_id', 'created_at', 'scraped_at', 'updated_at'))
+		return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+	@classmethod
+	def handle_saved_performance(cls, performance):
+		"""Record the saved performance so that seeds for its horse's and jockey's later races can be invalidated if it is new or has changed"""
+
+		if performance.get('date') is not None and performance.get('horse_url') is not None:
+			saved = {
+				'horse_url':	performance['horse_url'],
+				'jockey_url':	performance.get('jockey_url'),
+				'date':			performance['date'],
+				'digest':		cls.get_performance_digest(performance),
+				'saved_at':		datetime.now()
+			}
+			with cls.stale_lock:
+				cls.saved_performances.append(saved)
+
+	@classmethod
+	def handle_saved_race(cls, race):
+		"""Record the saved race so that its seeds can be invalidated"""
+
+		if '_id' in race:
+			with cls.stale_lock:
+				cls.stale_races.setdefault(race['_id'], datetime.now())
+
+	@classmethod
+	def handle_saved_runner(cls, runner):
+		"""Record the saved runner's race so that its seeds can be invalidated"""
+
+		if runner.get('race_id') is not None:
+			with cls.stale_lock:
+				cls.stale_races.setdefault(runner['race_id'], datetime.now())
+
+	@classmethod
+	def invalidate_stale(cls):
+		"""Mark the seeds for all races affected by the entities saved since the last call as stale
+
+		A race is affected if the race itself or one of its runners was saved, or if a new or changed performance was saved for one of its runners' horses or jockeys with a date before the race. Performances re-saved with unchanged values do not affect any races. Only seeds last updated before the triggering entity was saved are marked, so seeds generated from the saved entities are left alone. Stale seeds are regenerated the next time they are accessed.
+		"""
+
+		with cls.stale_lock:
+			stale_races = cls.stale_races
+			saved_performances = cls.saved_performances
+			cls.stale_races = {}
+			cls.saved_performances = []
+
+		stale_performances = {'horse_url': {}, 'jockey_url': {}}
+		if len(saved_performances) > 0:
+			for performance in cls.get_changed_performances(saved_performances):
+				for key in stale_performances:
+					if performance[key] is not None:
+						stale_performances[key].setdefault(performance[key], []).append((performance['date'], performance['saved_at']))
+
+		for key in stale_performances:
+			if len(stale_performances[key]) > 0:
+				runners = list(pyracing.Runner.get_database_collection().find({key: {'$in': list(stale_performances[key].keys())}}, {'race_id': 1, key: 1}))
+				start_times = dict((race['_id'], race['start_time']) for race in pyracing.Race.get_database_collection().find({'_id': {'$in': list(set(runner['race_id'] for runner in runners))}}, {'start_time': 1}))
+				for runner in runners:
+					start_time = start_times.get(runner['race_id'])
+					if start_time is not None:
+						for date, saved_at in stale_performances[key][runner[key]]:
+							if start_time > date:
+								stale_races[runner['race_id']] = min(stale_races.get(runner['race_id'], saved_at), saved_at)
+
+		if len(stale_races) > 0:
+
+			race_runner_ids = {}
+			for runner in pyracing.Runner.get_database_collection().find({'race_id': {'$in': list(stale_races.keys())}}, {'race_id': 1}):
+				race_runner_ids.setdefault(runner['race_id'], []).append(runner['_id'])
+
+			requests = [pymongo.UpdateMany({'runner_id': {'$in': runner_ids}, '$or': [{'updated_at': {'$lt': stale_races[race_id]}}, {'updated_at': {'$exists': False}}]}, {'$set': {'stale': True}}) for race_id, runner_ids in race_runner_ids.items()]
+			if len(requests) > 0:
+				collection = cls.get_database_collection()
+				result = collection.with_options(write_concern=collection.database.write_concern).bulk_write(requests, ordered=False)
+				if result.modified_count > 0:
+					logging.debug('Marked {count} seeds in {races} races as stale'.format(count=result.modified_count, races=len(requests)))
+
 	@classmethod
 	def initialize(cls):
 		"""Initialize class dependencies"""
@@ -73,44 +494,98 @@ class Seed(pyracing.Entity):
 
 		cls.event_manager.add_subscriber('deleting_runner', handle_deleting_runner)
 
-		cls.create_index([('runner_id', 1), ('seed_version', 1)])
+		IndexRegistry.create_index(cls, [('runner_id', 1), ('seed_version', 1)])
+
+		for key in ('horse_url', 'jockey_url'):
+			IndexRegistry.create_index(pyracing.Performance, [(key, 1), ('date', 1)])
+		for entity_class, name in ((pyracing.Horse, 'performances'), (pyracing.Jockey, 'performances'), (pyracing.Runner, 'horse'), (pyracing.Runner, 'jockey'), (pyracing.Runner, 'race')):
+			setattr(entity_class, name, cls.create_primed_property(getattr(entity_class, name), 'primed_' + name))
 
 		@property
 		def seeds(self):
 			"""Return a list of seeds for all runners in a race"""
 
 			if 'seeds' not in self.cache:
-				self.cache['seeds'] = [Seed.get_seed_by_runner(runner) for runner in self.runners]
+				self.cache['seeds'] = Seed.get_seeds_by_race(self)
 			return self.cache['seeds']
 
 		pyracing.Race.seeds = seeds
 
+	def __contains__(self, key):
+
+		if key in self.PACKED_KEYS and not super().__contains__(key):
+			return super().__contains__('packed_' + key)
+		return super().__contains__(key)
+
+	def __getitem__(self, key):
+
+		if key in self.PACKED_KEYS and not super().__contains__(key) and super().__contains__('packed_' + key):
+			if not 'unpacked_' + key in self.cache:
+				self.cache['unpacked_' + key] = Seed.unpack_values(super().__getitem__('packed_' + key))
+			return self.cache['unpacked_' + key]
+		return super().__getitem__(key)
+
+	def __setitem__(self, key, value):
+
+		if key in self.PACKED_KEYS:
+			self.cache.pop('unpacked_' + key, None)
+			if super().__contains__('packed_' + key):
+				super().__delitem__('packed_' + key)
+		super().__setitem__(key, value)
+
 	def __str__(self):
 
 		return 'seed for runner {runner}'.format(runner=self.runner)
 
+	def get_array(self, key):
+		"""Return the values for the specified key as a NumPy array, decoded without copying if the values are packed"""
+
+		if not super().__contains__(key) and super().__contains__('packed_' + key):
+			return Seed.unpack_array(super().__getitem__('packed_' + key))
+		return numpy.array(self[key], dtype=float)
+
+	def pack(self):
+		"""Replace the raw and normalized data lists with packed binary arrays of the configured dtype"""
+
+		for key in self.PACKED_KEYS:
+			if super().__contains__(key):
+				values = super().pop(key)
+				super().__setitem__('packed_' + key, Seed.pack_values(values, Seed.compact_dtype))
+				self.cache['unpacked_' + key] = values
+
+	def save(self):
+		"""Save the seed via the bulk writer if one has been configured, packing its data first if compact storage has been configured"""
+
+		if Seed.compact_dtype is not None:
+			self.pack()
+
+		if Seed.bulk_writer is not None:
+			Seed.bulk_writer.save(self)
+		else:
+			super().save()
+
 	@property
 	def normalized_data(self):
 		"""Return an array of the raw data values normalized for all runners in the race"""
 
 		if not 'normalized_data' in self:
-			
-			self['normalized_data'] = [0.5 for item in self['raw_data']]
-
-			for index in range(len(self['raw_data'])):
-				all_values = [seed['raw_data'][index] for seed in self.runner.race.seeds if seed['raw_data'][index] is not None]
-				if len(all_values) > 0 and max(all_values) > min(all_values):
-					own_value = self['raw_data'][index]
-					if own_value is None:
-						average_value = sum(all_values) / len(all_values)
-						self['normalized_data'][index] = (average_value - min(all_values)) / (max(all_values) - min(all_values))
-					else:
-						self['normalized_data'][index] = (own_value - min(all_values)) / (max(all_values) - min(all_values))
-
-			self.save()
+			Seed.normalize_seeds([seed for seed in self.runner.race.seeds if seed['runner_id'] != self['runner_id']] + [self])
 
 		return self['normalized_data']
 
+	@property
+	def normalized_array(self):
+		"""Return the normalized data as a NumPy array"""
+
+		self.normalized_data
+		return self.get_array('normalized_data')
+
+	@property
+	def raw_array(self):
+		"""Return the raw data as a NumPy array, with None values represented as NaN"""
+
+		return self.get_array('raw_data')
+
 	@property
 	def runner(self):
 		"""Return the runner to which this seed applies"""
@@ -124,15 +599,16 @@ class SeedProcessor(CommandLineProcessor):
 	"""Seed the database with query data for all runners in the specified date range"""
 
 	def __init__(self, *args, **kwargs):
-		"""Initialize instance dependencies"""
+		"""Initialize instance dependencies, and delete or convert any expired seeds"""
 
 		super().__init__(message_prefix='seeding', *args, **kwargs)
 
+		Seed.delete_expired()
+
 	def post_process_race(self, race):
 		"""Handle the post_process_race event by creating and normalizing seed data for the race's runners"""
 
-		for seed in race.seeds:
-			seed.normalized_data
+		Seed.normalize_seeds(race.seeds)
 
 
 def main():
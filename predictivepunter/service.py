@@ -0,0 +1,255 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import locale
+import logging
+import os
+import socketserver
+import sys
+import threading
+from urllib.parse import parse_qs, urlparse
+
+from bson import ObjectId
+from bson.errors import InvalidId
+import pyracing
+
+try:
+	from .predict import Prediction, PredictProcessor
+	from .seed import Seed
+except SystemError:
+	from predict import Prediction, PredictProcessor
+	from seed import Seed
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+	"""Answer HTTP GET requests with JSON responses from the server's prediction service"""
+
+	def address_string(self):
+
+		if isinstance(self.client_address, tuple):
+			return self.client_address[0]
+		return 'unix'
+
+	def do_GET(self):
+		"""Delegate the request to the prediction service and write its response as JSON"""
+
+		url = urlparse(self.path)
+		query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+
+		try:
+			status, body = self.server.service.handle_request(url.path, query)
+		except Exception as e:
+			logging.exception('Failed to handle request for {path}'.format(path=self.path))
+			status, body = 500, {'error': str(e)}
+
+		content = json.dumps(body, default=str).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(content)))
+		self.end_headers()
+		self.wfile.write(content)
+
+	def log_message(self, format, *args):
+
+		logging.debug('{address} {message}'.format(address=self.address_string(), message=format % args))
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+
+	daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+	daemon_threads = True
+
+
+class PredictionService(PredictProcessor):
+	"""Serve predictions for races and dates over HTTP from a long-running process
+
+	Trained predictors remain in the predictor cache for the life of the process, and the races (with their runners and seeds) for the most recently requested dates are kept in memory, so that repeated requests are answered without retraining or reloading. The service listens on a host:port address, or on a Unix socket if the address is a path.
+	"""
+
+	LONG_OPTIONS = [option for option in PredictProcessor.LONG_OPTIONS if option != 'batch-date'] + ['listen=']
+
+	@classmethod
+	def get_default_configuration(cls):
+		"""Return a dictionary of the default configuration values, including those for the service options"""
+
+		configuration = super().get_default_configuration()
+		configuration.update({
+			'listen':			'127.0.0.1:8642'
+		})
+		return configuration
+
+	@classmethod
+	def set_option(cls, configuration, opt, arg):
+		"""Update the configuration with the value for the specified command-line option, including the service options"""
+
+		if opt == '--listen':
+			configuration['listen'] = arg
+
+		else:
+			super().set_option(configuration, opt, arg)
+
+	def __init__(self, listen='127.0.0.1:8642', cached_dates=3, *args, **kwargs):
+		"""Initialize instance dependencies"""
+
+		super().__init__(csv_writer=None, *args, **kwargs)
+
+		self.listen = listen
+		self.cached_dates = cached_dates
+
+		self.races = OrderedDict()
+		self.date_locks = {}
+		self.races_lock = threading.RLock()
+
+	def create_server(self):
+		"""Return a threaded HTTP server for the configured address, with this service attached"""
+
+		if os.sep in self.listen:
+			if os.path.exists(self.listen):
+				os.remove(self.listen)
+			server = ThreadingUnixHTTPServer(self.listen, PredictionRequestHandler)
+		else:
+			host, port = self.listen.rsplit(':', 1)
+			server = ThreadingHTTPServer((host, int(port)), PredictionRequestHandler)
+
+		server.service = self
+		return server
+
+	def get_date_lock(self, date):
+		"""Return the lock that serializes prediction requests for the specified date"""
+
+		with self.races_lock:
+			return self.date_locks.setdefault(date, threading.RLock())
+
+	def get_predictions(self, races, refresh=False):
+		"""Return a list of prediction dictionaries for the specified races, first reloading their runners and regenerating their seeds and predictions if refresh is True"""
+
+		if refresh:
+			self.refresh_races(races)
+
+		for race, prediction in zip(races, Prediction.get_predictions_by_races(races)):
+			race.cache['prediction'] = prediction
+		self.flush_writes()
+
+		predictions = []
+		for race in races:
+			row = self.get_row(race)
+			if row is not None:
+				prediction = dict(zip(self.CSV_HEADER, row))
+				prediction['Race ID'] = race['_id']
+				predictions.append(prediction)
+		return predictions
+
+	def get_races_by_date(self, date):
+		"""Return the races for the specified date, keeping them in memory for subsequent requests"""
+
+		with self.races_lock:
+			if date in self.races:
+				self.races.move_to_end(date)
+				return self.races[date]
+
+		races = [race for meet in pyracing.Meet.get_meets_by_date(date) for race in meet.races]
+
+		with self.races_lock:
+			self.races[date] = races
+			while len(self.races) > self.cached_dates:
+				expired_date, expired_races = self.races.popitem(last=False)
+				self.date_locks.pop(expired_date, None)
+			return races
+
+	def handle_request(self, path, query):
+		"""Return a tuple of the HTTP status and response body for the specified request path and query parameters"""
+
+		refresh = query.get('refresh', '0').lower() in ('1', 'true', 'yes')
+
+		if path == '/predictions':
+
+			if 'race_id' in query:
+				try:
+					race = pyracing.Race.get_race_by_id(ObjectId(query['race_id']))
+				except InvalidId:
+					return 400, {'error': 'invalid race_id'}
+				if race is None:
+					return 404, {'error': 'race not found'}
+
+				date = race.meet['date']
+				with self.get_date_lock(date):
+					races = [cached_race for cached_race in self.get_races_by_date(date) if cached_race['_id'] == race['_id']] or [race]
+					return 200, self.get_predictions(races, refresh)
+
+			elif 'date' in query:
+				try:
+					date = datetime.strptime(query['date'], '%Y-%m-%d')
+				except ValueError:
+					return 400, {'error': 'dates must be formatted as YYYY-MM-DD'}
+
+				with self.get_date_lock(date):
+					return 200, self.get_predictions(self.get_races_by_date(date), refresh)
+
+			return 400, {'error': 'either race_id or date is required'}
+
+		elif path == '/status':
+			with self.races_lock:
+				return 200, {
+					'cached_dates':		sorted(date.strftime('%Y-%m-%d') for date in self.races),
+					'predictor_cache':	Prediction.predictor_cache.get_statistics()
+				}
+
+		return 404, {'error': 'not found'}
+
+	def refresh_races(self, races):
+		"""Discard the cached runners, seeds and predictions for the specified races so that they are reloaded and regenerated on the next request"""
+
+		self.flush_writes()
+
+		Prediction.get_database_collection().delete_many({'race_id': {'$in': [race['_id'] for race in races]}})
+		for race in races:
+			for key in ('prediction', 'runners', 'seeds'):
+				race.cache.pop(key, None)
+			Seed.handle_saved_race(race)
+		Seed.invalidate_stale()
+
+	def serve(self):
+		"""Answer requests until interrupted"""
+
+		server = self.create_server()
+		logging.info('Serving predictions on {address}'.format(address=self.listen))
+
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			server.server_close()
+			self.flush_writes()
+			if os.sep in self.listen and os.path.exists(self.listen):
+				os.remove(self.listen)
+
+	def warm(self, date_from, date_to):
+		"""Load the races and generate the predictions for all dates in the specified range, so that the corresponding predictors and seeds are in memory before the first request"""
+
+		date = date_from
+		while date <= date_to:
+			with self.get_date_lock(date):
+				self.get_predictions(self.get_races_by_date(date))
+			date += timedelta(days=1)
+
+
+def main():
+	"""Main entry point for the serve console script"""
+
+	locale.setlocale(locale.LC_ALL, '')
+
+	configuration = PredictionService.get_configuration(sys.argv[1:])
+
+	service = PredictionService(**configuration)
+	service.warm(date_from=configuration['date_from'], date_to=configuration['date_to'])
+	service.serve()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,110 @@
+from datetime import datetime
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+
+class ModelStore:
+	"""Persist trained segment predictors to the local filesystem for reuse across runs"""
+
+	DATE_FORMAT = '%Y%m%d'
+
+	def __init__(self, directory, prediction_version, seed_version, retrain_days=7, retrain_races=0):
+		"""Initialize instance dependencies
+
+		A stored predictor is considered valid until retrain_days have passed since its training cutoff date, or until retrain_races new races have been added to its segment. A value of 0 for either setting disables that check.
+		"""
+
+		self.directory = directory
+		self.prediction_version = prediction_version
+		self.seed_version = seed_version
+		self.retrain_days = retrain_days
+		self.retrain_races = retrain_races
+
+		self.lock = threading.RLock()
+
+	def get_segment_directory(self, segment):
+		"""Return the directory in which predictors for the specified segment are stored"""
+
+		segment_hash = hashlib.sha1(repr(segment).encode('utf-8')).hexdigest()
+		return os.path.join(self.directory, 'p{prediction_version}-s{seed_version}'.format(prediction_version=self.prediction_version, seed_version=self.seed_version), segment_hash)
+
+	def get_path(self, segment, cutoff_date):
+		"""Return the path to the file containing the predictor for the specified segment and training cutoff date"""
+
+		return os.path.join(self.get_segment_directory(segment), cutoff_date.strftime(self.DATE_FORMAT) + '.pickle')
+
+	def is_valid(self, metadata, date, race_count):
+		"""Determine whether a stored predictor with the specified metadata can be reused for the specified date and segment race count"""
+
+		if metadata['cutoff_date'] > date:
+			return False
+		if self.retrain_days > 0 and (date - metadata['cutoff_date']).days >= self.retrain_days:
+			return False
+		if self.retrain_races > 0 and race_count - metadata['race_count'] >= self.retrain_races:
+			return False
+		return True
+
+	def load(self, segment, date, race_count):
+		"""Return the most recent stored predictor for the specified segment that is still valid for the specified date, or None if there is no such predictor"""
+
+		segment_directory = self.get_segment_directory(segment)
+		if not os.path.isdir(segment_directory):
+			return None
+
+		cutoff_dates = []
+		for filename in os.listdir(segment_directory):
+			name, extension = os.path.splitext(filename)
+			if extension == '.pickle':
+				try:
+					cutoff_dates.append(datetime.strptime(name, self.DATE_FORMAT))
+				except ValueError:
+					continue
+
+		for cutoff_date in sorted(cutoff_dates, reverse=True):
+			if cutoff_date <= date:
+				try:
+					with open(self.get_path(segment, cutoff_date), 'rb') as f:
+						stored = pickle.load(f)
+				except (EOFError, OSError, pickle.UnpicklingError) as e:
+					logging.warning('Unable to load stored predictor for {segment} at {cutoff_date}: {exception}'.format(segment=segment, cutoff_date=cutoff_date, exception=e))
+					return None
+
+				if self.is_valid(stored['metadata'], date, race_count):
+					logging.debug('Reusing stored {estimator} predictor for {segment} trained at {cutoff_date}'.format(estimator=stored['predictor']['estimator'], segment=segment, cutoff_date=cutoff_date))
+					return stored['predictor']
+				return None
+
+	def save(self, segment, cutoff_date, race_count, predictor):
+		"""Store the specified predictor for the specified segment and training cutoff date"""
+
+		stored = {
+			'metadata': {
+				'segment':				segment,
+				'cutoff_date':			cutoff_date,
+				'race_count':			race_count,
+				'prediction_version':	self.prediction_version,
+				'seed_version':			self.seed_version,
+				'score':				predictor['score'],
+				'train_seeds':			predictor['train_seeds'],
+				'test_seeds':			predictor['test_seeds'],
+				'estimator':			predictor['estimator'],
+				'created_at':			datetime.now()
+			},
+			'predictor': predictor
+		}
+
+		path = self.get_path(segment, cutoff_date)
+		with self.lock:
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+			try:
+				with os.fdopen(handle, 'wb') as f:
+					pickle.dump(stored, f, pickle.HIGHEST_PROTOCOL)
+				os.replace(temp_path, path)
+			except:
+				os.remove(temp_path)
+				raise
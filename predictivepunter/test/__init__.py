@@ -1,3 +1,11 @@
+from .backtest import *
+from .backup import *
+from .benchmark import *
+from .cache import *
+from .estimators import *
+from .live import *
 from .scrape import *
 from .seed import *
 from .predict import *
+from .pipeline import *
+from .service import *
@@ -0,0 +1,39 @@
+from datetime import datetime
+import logging
+import unittest
+
+from predictivepunter.backtest import Backtest
+from predictivepunter.benchmark import SyntheticScraper
+from predictivepunter.scrape import ScrapeProcessor
+from predictivepunter.seed import SeedProcessor
+import pymongo
+
+
+class BacktestTest(unittest.TestCase):
+
+	def test_backtest(self):
+		"""The run method should evaluate every race in the date range and report hit rates for each pick"""
+
+		configuration = {
+			'database_name':	'predictivepunter_backtest_test',
+			'logging_level':	logging.DEBUG,
+			'scraper':			SyntheticScraper(meets_per_date=1, races_per_meet=4, runners_per_race=4, performances_per_horse=2),
+			'threads':			2
+		}
+
+		pymongo.MongoClient().drop_database(configuration['database_name'])
+		for processor_class in (ScrapeProcessor, SeedProcessor):
+			processor_class(**configuration).process_dates(datetime(2016, 2, 1), datetime(2016, 2, 6))
+
+		backtest = Backtest(retrain_interval=2, **configuration)
+		self.assertEqual(backtest.get_cutoff_date(datetime(2016, 2, 3), datetime(2016, 2, 6)), datetime(2016, 2, 5))
+
+		report = backtest.run(datetime(2016, 2, 3), datetime(2016, 2, 6))
+
+		self.assertEqual(report['races'], 16)
+		self.assertEqual(sorted(report['picks'].keys()), sorted(Backtest.PICKS))
+		for pick in report['picks'].values():
+			if pick['hit_rate'] is not None:
+				self.assertGreaterEqual(pick['hit_rate'], 0)
+				self.assertLessEqual(pick['hit_rate'], 1)
+		self.assertEqual(pymongo.MongoClient()[configuration['database_name']]['predictions'].count(), 0)
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from predictivepunter.backup import IncrementalBackup
+from predictivepunter.benchmark import SyntheticScraper
+from predictivepunter.scrape import ScrapeProcessor
+import pymongo
+
+
+class IncrementalBackupTest(unittest.TestCase):
+
+	def setUp(self):
+
+		self.backup_directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+
+		shutil.rmtree(self.backup_directory)
+
+	def test_dump_database(self):
+		"""The dump_database method should take a full dump when none has been recorded or the full backup interval has elapsed since the last one, across separate processors, and export incremental backups otherwise"""
+
+		configuration = {
+			'backup_database':		True,
+			'backup_directory':		self.backup_directory,
+			'database_name':		'predictivepunter_backup_test',
+			'incremental_backup':	True,
+			'logging_level':		logging.DEBUG,
+			'scraper':				SyntheticScraper(meets_per_date=1, races_per_meet=2, runners_per_race=4, performances_per_horse=2),
+			'threads':				2
+		}
+
+		client = pymongo.MongoClient()
+		database = client[configuration['database_name']]
+		client.drop_database(configuration['database_name'])
+		archive_directory = os.path.join(self.backup_directory, configuration['database_name'])
+
+		processor = ScrapeProcessor(**configuration)
+		processor.process_dates(datetime(2016, 2, 1), datetime(2016, 2, 1))
+		last_full_dump = processor.incremental_backup.get_last_full_dump()
+		self.assertIsNotNone(last_full_dump)
+		self.assertFalse(os.path.isdir(archive_directory))
+
+		processor = ScrapeProcessor(**configuration)
+		processor.process_dates(datetime(2016, 2, 2), datetime(2016, 2, 2))
+		self.assertEqual(processor.incremental_backup.get_last_full_dump(), last_full_dump)
+		self.assertEqual(len(os.listdir(archive_directory)), 1)
+
+		client.drop_database(configuration['database_name'])
+		IncrementalBackup(database, self.backup_directory).restore()
+		self.assertEqual(database['meets'].count(), 1)
+
+		processor.incremental_backup.record_full_dump(last_full_dump - timedelta(days=7))
+		processor = ScrapeProcessor(**configuration)
+		processor.process_dates(datetime(2016, 2, 3), datetime(2016, 2, 3))
+		self.assertGreater(processor.incremental_backup.get_last_full_dump(), last_full_dump)
+		self.assertEqual(len(os.listdir(archive_directory)), 1)
+
+	def test_export_nothing(self):
+		"""The export method should return None if nothing has been saved since the last backup"""
+
+		backup = IncrementalBackup(pymongo.MongoClient()['predictivepunter_backup_test'], self.backup_directory)
+		self.assertIsNone(backup.export())
@@ -0,0 +1,31 @@
+from datetime import datetime
+import logging
+import unittest
+
+from predictivepunter.benchmark import Benchmark
+
+
+class BenchmarkTest(unittest.TestCase):
+
+	def test_benchmark(self):
+		"""The run method should time each stage at each scale and thread count against synthetic data"""
+
+		benchmark = Benchmark(
+			database_name='predictivepunter_benchmark_test',
+			date_from=datetime(2016, 2, 1),
+			days=2,
+			scales=(1,),
+			thread_counts=(1, 2),
+			logging_level=logging.DEBUG,
+			meets_per_date=1,
+			races_per_meet=2,
+			runners_per_race=4,
+			performances_per_horse=2
+			)
+		results = benchmark.run()
+
+		self.assertEqual(len(results), 6)
+		for result in results:
+			self.assertIn(result['stage'], ('scrape', 'seed', 'predict'))
+			self.assertGreaterEqual(result['seconds'], 0)
+			self.assertGreater(result['documents']['races'], 0)
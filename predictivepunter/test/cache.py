@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from predictivepunter.cache import PredictorCache
+
+
+class PredictorCacheTest(unittest.TestCase):
+
+	PREDICTOR_SIZE = 1000
+
+	def setUp(self):
+
+		self.spill_directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+
+		shutil.rmtree(self.spill_directory)
+
+	def create_cache(self, **kwargs):
+		"""Return a predictor cache large enough for two predictors"""
+
+		return PredictorCache(size_limit=self.PREDICTOR_SIZE * 2 + self.PREDICTOR_SIZE // 2, **kwargs)
+
+	def add(self, cache, key):
+		"""Add a predictor for the specified key to the specified cache"""
+
+		future, created = cache.get_or_create(key)
+		self.assertTrue(created)
+		cache.set_result(key, future, key * self.PREDICTOR_SIZE)
+
+	def use(self, cache, key):
+		"""Look up the predictor for the specified key in the specified cache"""
+
+		future, created = cache.get_or_create(key)
+		self.assertFalse(created)
+		self.assertEqual(future.result(), key * self.PREDICTOR_SIZE)
+
+	def test_discard(self):
+		"""The discard method should only remove the specified future"""
+
+		cache = PredictorCache()
+		future, created = cache.get_or_create('a')
+
+		cache.discard('a', cache.get_or_create('b')[0])
+		self.assertIn('a', cache)
+
+		cache.discard('a', future)
+		self.assertNotIn('a', cache)
+		self.assertEqual(len(cache), 1)
+
+	def test_lfu(self):
+		"""The lfu policy should evict the least frequently used predictor"""
+
+		cache = self.create_cache(policy='lfu')
+		self.add(cache, 'a')
+		self.add(cache, 'b')
+		self.use(cache, 'a')
+		self.use(cache, 'a')
+		self.use(cache, 'b')
+		self.add(cache, 'c')
+
+		self.assertIn('a', cache)
+		self.assertNotIn('b', cache)
+		self.assertIn('c', cache)
+		self.assertEqual(cache.get_statistics()['evictions'], 1)
+
+	def test_lru(self):
+		"""The lru policy should evict the least recently used predictor"""
+
+		cache = self.create_cache(policy='lru')
+		self.add(cache, 'a')
+		self.add(cache, 'b')
+		self.use(cache, 'a')
+		self.use(cache, 'a')
+		self.use(cache, 'b')
+		self.add(cache, 'c')
+
+		self.assertNotIn('a', cache)
+		self.assertIn('b', cache)
+		self.assertIn('c', cache)
+
+	def test_spill(self):
+		"""Evicted predictors should be reloaded from the spill directory, and removed from it when the cache is cleared"""
+
+		cache = self.create_cache(spill_directory=self.spill_directory)
+		for key in ('a', 'b', 'c'):
+			self.add(cache, key)
+		self.assertNotIn('a', cache)
+		self.assertEqual(cache.get_statistics()['spilled'], 1)
+
+		future, created = cache.get_or_create('a')
+		self.assertTrue(created)
+		predictor = cache.load_spilled('a')
+		self.assertEqual(predictor, 'a' * self.PREDICTOR_SIZE)
+		cache.set_result('a', future, predictor)
+		self.assertEqual(cache.get_statistics()['spill_loads'], 1)
+		self.assertIsNone(cache.load_spilled('a'))
+
+		cache.clear()
+		self.assertEqual(os.listdir(self.spill_directory), [])
@@ -0,0 +1,58 @@
+import os
+import time
+import unittest
+
+from predictivepunter.estimators import CandidateHistory, EstimatorPool
+
+
+class CandidateHistoryTest(unittest.TestCase):
+
+	def test_get_candidates(self):
+		"""The get_candidates method should skip consistently losing estimators, but periodically try them again"""
+
+		history = CandidateHistory(skip_after=2, retry_every=3)
+		names = ['A', 'B', 'C']
+
+		self.assertEqual(history.get_candidates('segment', names), names)
+		for name in names:
+			history.record('segment', name, name == 'A')
+		self.assertEqual(history.get_candidates('segment', names), names)
+		for name in names:
+			history.record('segment', name, name == 'A')
+
+		self.assertEqual(history.get_candidates('segment', names), names)
+		for name in names:
+			history.record('segment', name, name == 'B')
+
+		self.assertEqual(history.get_candidates('segment', names), ['A', 'B'])
+		self.assertEqual(history.get_candidates('other', names), names)
+
+	def test_get_candidates_all_skipped(self):
+		"""The get_candidates method should return all estimators if all of them would otherwise be skipped"""
+
+		history = CandidateHistory(skip_after=1, retry_every=0)
+		for name in ('A', 'B'):
+			history.record('segment', name, False)
+
+		self.assertEqual(history.get_candidates('segment', ['A', 'B']), ['A', 'B'])
+
+
+class EstimatorPoolTest(unittest.TestCase):
+
+	def test_recycle(self):
+		"""The recycle method should terminate the specified workers and replace them with fresh ones"""
+
+		pool = EstimatorPool(1)
+		try:
+			pid = pool.submit(os.getpid).result()
+			future = pool.submit(time.sleep, 60)
+			while not future.running():
+				time.sleep(0.01)
+
+			pool.recycle([pid])
+
+			self.assertNotEqual(pool.submit(os.getpid).result(timeout=10), pid)
+			with self.assertRaises(Exception):
+				future.result(timeout=10)
+		finally:
+			pool.shutdown()
@@ -0,0 +1,68 @@
+from datetime import datetime
+import logging
+import unittest
+
+from predictivepunter.benchmark import NullCsvWriter, SyntheticScraper
+from predictivepunter.live import LiveProcessor
+import pymongo
+import pyracing
+
+
+class ChangingScraper(SyntheticScraper):
+	"""Synthetic scraper that reports a different track condition for the races with the specified URLs and omits the races with the removed URLs"""
+
+	def __init__(self, *args, **kwargs):
+
+		super().__init__(*args, **kwargs)
+		self.changed_urls = set()
+		self.removed_urls = set()
+
+	def scrape_races(self, meet):
+
+		races = [race for race in super().scrape_races(meet) if race['url'] not in self.removed_urls]
+		for race in races:
+			if race['url'] in self.changed_urls:
+				race['track_condition'] = [condition for condition in self.TRACK_CONDITIONS if condition != race['track_condition']][0]
+		return races
+
+
+class LiveProcessorTest(unittest.TestCase):
+
+	def test_poll(self):
+		"""The poll method should update and re-predict only the races that have changed"""
+
+		configuration = {
+			'database_name':	'predictivepunter_live_test',
+			'date_from':		datetime(2016, 2, 1),
+			'date_to':			datetime(2016, 2, 1),
+			'logging_level':	logging.DEBUG,
+			'scraper':			ChangingScraper(meets_per_date=1, races_per_meet=2, runners_per_race=4, performances_per_horse=2),
+			'threads':			2
+		}
+
+		database = pymongo.MongoClient()[configuration['database_name']]
+		pymongo.MongoClient().drop_database(configuration['database_name'])
+
+		csv_writer = NullCsvWriter()
+		processor = LiveProcessor(csv_writer=csv_writer, **configuration)
+		processor.process_dates(configuration['date_from'], configuration['date_to'])
+		self.assertEqual(csv_writer.rows, 2)
+
+		races = [race for meet in pyracing.Meet.get_meets_by_date(configuration['date_from']) for race in meet.races]
+		self.assertEqual(processor.poll(races), [])
+		self.assertEqual(csv_writer.rows, 2)
+
+		track_condition = races[0]['track_condition']
+		configuration['scraper'].changed_urls.add(races[0]['url'])
+		changed = processor.poll(races)
+		self.assertEqual([race['_id'] for race in changed], [races[0]['_id']])
+		self.assertEqual(csv_writer.rows, 3)
+
+		self.assertNotEqual(database['races'].find_one({'_id': races[0]['_id']})['track_condition'], track_condition)
+		self.assertEqual(database['runners'].count(), 8)
+		self.assertEqual(database['predictions'].count(), 2)
+
+		configuration['scraper'].removed_urls.add(races[1]['url'])
+		self.assertEqual(processor.poll(races), [])
+		self.assertEqual(database['predictions'].count(), 1)
+		self.assertIn(races[1]['_id'], processor.unlisted)
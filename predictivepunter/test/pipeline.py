@@ -0,0 +1,34 @@
+from datetime import datetime
+import logging
+import unittest
+
+from predictivepunter.benchmark import NullCsvWriter, SyntheticScraper
+from predictivepunter.pipeline import PipelineProcessor
+import pymongo
+
+
+class PipelineProcessorTest(unittest.TestCase):
+
+	def test_pipeline(self):
+		"""The process_dates method should scrape, seed and predict all races in a single pass"""
+
+		configuration = {
+			'database_name':	'predictivepunter_pipeline_test',
+			'date_from':		datetime(2016, 2, 1),
+			'date_to':			datetime(2016, 2, 2),
+			'logging_level':	logging.DEBUG,
+			'scraper':			SyntheticScraper(meets_per_date=1, races_per_meet=2, runners_per_race=4, performances_per_horse=2),
+			'threads':			2
+		}
+
+		database = pymongo.MongoClient()[configuration['database_name']]
+		pymongo.MongoClient().drop_database(configuration['database_name'])
+
+		csv_writer = NullCsvWriter()
+		processor = PipelineProcessor(csv_writer=csv_writer, **configuration)
+		processor.process_dates(configuration['date_from'], configuration['date_to'])
+
+		self.assertEqual(database['races'].count(), 4)
+		self.assertEqual(database['seeds'].count(), database['runners'].count())
+		self.assertEqual(database['predictions'].count(), 4)
+		self.assertEqual(csv_writer.rows, 4)
@@ -6,7 +6,8 @@ import unittest
 
 import cache_requests
 from lxml import html
-from predictivepunter.predict import PredictProcessor
+from predictivepunter.benchmark import NullCsvWriter, SyntheticScraper
+from predictivepunter.predict import Prediction, PredictProcessor
 import pymongo
 import pypunters
 
@@ -36,4 +37,22 @@ class PredictProcessorTest(unittest.TestCase):
 		processor.process_dates(configuration['date_from'], configuration['date_to'])
 
 		self.assertGreater(database['predictions'].count(), 0)
-		self.assertTrue(os.path.isdir(dump_directory))
\ No newline at end of file
+		self.assertTrue(os.path.isdir(dump_directory))
+
+	def test_estimator_executor(self):
+		"""Predict processors with the same number of estimator processes should share a single process pool"""
+
+		configuration = {
+			'database_name':		'predictivepunter_predict_test',
+			'estimator_processes':	2,
+			'scraper':				SyntheticScraper()
+		}
+
+		PredictProcessor(csv_writer=NullCsvWriter(), **configuration)
+		executor = Prediction.estimator_executor
+		PredictProcessor(csv_writer=NullCsvWriter(), **configuration)
+		self.assertIs(Prediction.estimator_executor, executor)
+
+		configuration['estimator_processes'] = 0
+		PredictProcessor(csv_writer=NullCsvWriter(), **configuration)
+		self.assertIsNone(Prediction.estimator_executor)
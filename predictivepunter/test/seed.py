@@ -6,9 +6,11 @@ import unittest
 
 import cache_requests
 from lxml import html
-from predictivepunter.seed import SeedProcessor
+from predictivepunter.benchmark import SyntheticScraper
+from predictivepunter.seed import Seed, SeedProcessor
 import pymongo
 import pypunters
+import pyracing
 
 
 class SeedProcessorTest(unittest.TestCase):
@@ -36,4 +38,92 @@ class SeedProcessorTest(unittest.TestCase):
 		processor.process_dates(configuration['date_from'], configuration['date_to'])
 
 		self.assertGreater(database['seeds'].count(), 0)
-		self.assertTrue(os.path.isdir(dump_directory))
\ No newline at end of file
+		self.assertTrue(os.path.isdir(dump_directory))
+
+	def test_invalidate_stale(self):
+		"""The invalidate_stale method should mark seeds as stale when a performance changes, but not when it is re-saved unchanged"""
+
+		configuration = {
+			'database_name':	'predictivepunter_seed_test',
+			'date_from':		datetime(2016, 2, 1),
+			'date_to':			datetime(2016, 2, 1),
+			'logging_level':	logging.DEBUG,
+			'scraper':			SyntheticScraper(meets_per_date=1, races_per_meet=2, runners_per_race=4, performances_per_horse=2),
+			'threads':			2
+		}
+
+		database = pymongo.MongoClient()[configuration['database_name']]
+		pymongo.MongoClient().drop_database(configuration['database_name'])
+
+		processor = SeedProcessor(**configuration)
+		processor.process_dates(configuration['date_from'], configuration['date_to'])
+
+		stale_count = database['seeds'].count({'stale': True})
+		runner = database['runners'].find_one()
+		performance = pyracing.Performance.find_one({'horse_url': runner['horse_url'], 'date': {'$lt': configuration['date_from']}})
+
+		performance.save()
+		Seed.invalidate_stale()
+		self.assertEqual(database['seeds'].count({'stale': True}), stale_count)
+
+		performance['result'] += 1
+		performance.save()
+		Seed.invalidate_stale()
+		self.assertGreater(database['seeds'].count({'stale': True}), stale_count)
+
+	def test_prime_runners(self):
+		"""Seeds generated for primed runners should be identical to those generated for unprimed runners"""
+
+		configuration = {
+			'database_name':	'predictivepunter_seed_test',
+			'date_from':		datetime(2016, 2, 1),
+			'date_to':			datetime(2016, 2, 1),
+			'logging_level':	logging.DEBUG,
+			'scraper':			SyntheticScraper(meets_per_date=1, races_per_meet=2, runners_per_race=4, performances_per_horse=4),
+			'threads':			2
+		}
+
+		pymongo.MongoClient().drop_database(configuration['database_name'])
+
+		processor = SeedProcessor(**configuration)
+		processor.process_dates(configuration['date_from'], configuration['date_to'])
+
+		for race in pyracing.Race.find({}):
+			expected = [Seed.generate_seed(runner)['raw_data'] for runner in pyracing.Runner.find({'race_id': race['_id']})]
+
+			runners = pyracing.Runner.find({'race_id': race['_id']})
+			Seed.prime_runners(race, runners)
+			for runner in runners:
+				self.assertIn('primed_performances', runner.horse.cache)
+
+			self.assertEqual([Seed.generate_seed(runner)['raw_data'] for runner in runners], expected)
+
+	def test_delete_expired(self):
+		"""The delete_expired method should convert seeds to the configured dtype only when the configured format has changed"""
+
+		configuration = {
+			'compact_seeds':	'float32',
+			'database_name':	'predictivepunter_seed_test',
+			'date_from':		datetime(2016, 2, 1),
+			'date_to':			datetime(2016, 2, 1),
+			'logging_level':	logging.DEBUG,
+			'scraper':			SyntheticScraper(meets_per_date=1, races_per_meet=2, runners_per_race=4, performances_per_horse=2),
+			'threads':			2
+		}
+
+		database = pymongo.MongoClient()[configuration['database_name']]
+		pymongo.MongoClient().drop_database(configuration['database_name'])
+
+		processor = SeedProcessor(**configuration)
+		processor.process_dates(configuration['date_from'], configuration['date_to'])
+		self.assertEqual(database['seeds'].count({'packed_raw_data.dtype': 'float32'}), 8)
+		self.assertEqual(database['metadata'].find_one({'_id': 'seed_format'})['dtype'], 'float32')
+
+		configuration['compact_seeds'] = 'float64'
+		SeedProcessor(**configuration)
+		self.assertEqual(database['seeds'].count({'packed_raw_data.dtype': 'float64'}), 8)
+		self.assertEqual(database['metadata'].find_one({'_id': 'seed_format'})['dtype'], 'float64')
+
+		database['seeds'].update_many({}, {'$set': {'packed_raw_data.dtype': 'float16'}})
+		SeedProcessor(**configuration)
+		self.assertEqual(database['seeds'].count({'packed_raw_data.dtype': 'float16'}), 8)
@@ -0,0 +1,53 @@
+import json
+import logging
+import threading
+import unittest
+from urllib.request import urlopen
+
+from predictivepunter.benchmark import SyntheticScraper
+from predictivepunter.service import PredictionService
+import pymongo
+
+
+class PredictionServiceTest(unittest.TestCase):
+
+	def test_serve(self):
+		"""The service should answer prediction requests for a date and a race over HTTP"""
+
+		configuration = {
+			'database_name':	'predictivepunter_service_test',
+			'listen':			'127.0.0.1:0',
+			'logging_level':	logging.DEBUG,
+			'scraper':			SyntheticScraper(meets_per_date=1, races_per_meet=2, runners_per_race=4, performances_per_horse=2),
+			'threads':			2
+		}
+
+		pymongo.MongoClient().drop_database(configuration['database_name'])
+
+		service = PredictionService(**configuration)
+		server = service.create_server()
+		thread = threading.Thread(target=server.serve_forever)
+		thread.start()
+
+		try:
+			address = 'http://{host}:{port}'.format(host=server.server_address[0], port=server.server_address[1])
+
+			with urlopen(address + '/predictions?date=2016-02-01') as response:
+				predictions = json.loads(response.read().decode('utf-8'))
+			self.assertEqual(len(predictions), 2)
+			for prediction in predictions:
+				self.assertEqual(prediction['Date'], '2016-02-01')
+
+			with urlopen(address + '/predictions?refresh=1&race_id=' + predictions[0]['Race ID']) as response:
+				refreshed = json.loads(response.read().decode('utf-8'))
+			self.assertEqual(len(refreshed), 1)
+			self.assertEqual(refreshed[0]['Race'], predictions[0]['Race'])
+
+			with urlopen(address + '/status') as response:
+				status = json.loads(response.read().decode('utf-8'))
+			self.assertEqual(status['cached_dates'], ['2016-02-01'])
+
+		finally:
+			server.shutdown()
+			server.server_close()
+			thread.join()
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from datetime import datetime
+import logging
+import threading
+import time
+
+from bson import ObjectId
+import pymongo
+
+
+class BulkWriter:
+	"""Buffer entity upserts and write them to the database in bulk
+
+	Pending entities are also indexed by collection and by the values of their INDEX_KEYS, so that they can be found by find_pending without scanning the whole buffer. Entities being flushed remain findable until their bulk write has completed.
+	"""
+
+	INDEX_KEYS = ('race_id', 'runner_id')
+
+	def __init__(self, batch_size=500, flush_interval=30):
+		"""Initialize instance dependencies"""
+
+		self.batch_size = batch_size
+		self.flush_interval = flush_interval
+
+		self.pending = {}
+		self.index = {}
+		self.index_keys = {}
+		self.in_flight = []
+		self.lock = threading.RLock()
+		self.last_flushed = time.time()
+
+	def find_pending(self, entity_class, filter):
+		"""Return the first pending entity of the specified class matching all values in filter, or None if there is no such entity"""
+
+		collection_name = entity_class.get_database_collection().name
+		with self.lock:
+			for index in [self.index] + self.in_flight[::-1]:
+				entity = self.find_indexed(index, collection_name, filter)
+				if entity is not None:
+					return entity
+
+	def find_indexed(self, index, name, filter):
+		"""Return the first entity in the specified index for the named collection matching all values in filter, or None if there is no such entity"""
+
+		for key in self.INDEX_KEYS:
+			if key in filter:
+				candidates = index.get((name, key, filter[key]), {}).values()
+				break
+		else:
+			candidates = index.get((name, None, None), {}).values()
+
+		for entity in candidates:
+			if all(key in entity and entity[key] == filter[key] for key in filter):
+				return entity
+
+	def get_index_keys(self, name, entity):
+		"""Return a list of the index keys under which the specified pending entity is found"""
+
+		keys = [(name, None, None)]
+		for key in self.INDEX_KEYS:
+			if entity.get(key) is not None:
+				keys.append((name, key, entity[key]))
+		return keys
+
+	def flush(self):
+		"""Write all pending entities to the database, keeping them findable by find_pending until they have been written"""
+
+		with self.lock:
+			pending = self.pending
+			index = self.index
+			self.pending = {}
+			self.index = {}
+			self.index_keys = {}
+			self.last_flushed = time.time()
+			if len(pending) > 0:
+				self.in_flight.append(index)
+
+		if len(pending) > 0:
+			try:
+				self.write(pending)
+			finally:
+				with self.lock:
+					self.in_flight = [flushing for flushing in self.in_flight if flushing is not index]
+
+	def write(self, pending):
+		"""Write the specified pending entities to the database in one bulk write per collection, then publish their saved events"""
+
+		batches = {}
+		for (name, id), entity in pending.items():
+			if name not in batches:
+				batches[name] = (entity.get_database_collection(), [])
+			batches[name][1].append(entity)
+
+		for name in batches:
+			collection, entities = batches[name]
+			logging.debug('Writing {count} {name} in bulk'.format(count=len(entities), name=name))
+			collection.bulk_write([pymongo.ReplaceOne({'_id': entity['_id']}, entity, upsert=True) for entity in entities], ordered=False)
+
+			for entity in entities:
+				entity.event_manager.publish('saved_' + entity.__class__.__name__.lower(), entity)
+
+	def save(self, entity):
+		"""Add the specified entity to the pending upserts, flushing if the batch size or flush interval has been reached"""
+
+		if '_id' not in entity:
+			entity['_id'] = ObjectId()
+		entity.setdefault('created_at', datetime.now())
+		entity['updated_at'] = datetime.now()
+
+		name = entity.get_database_collection().name
+		with self.lock:
+			for key in self.index_keys.get((name, entity['_id']), []):
+				self.index[key].pop(entity['_id'], None)
+			self.pending[(name, entity['_id'])] = entity
+			self.index_keys[(name, entity['_id'])] = self.get_index_keys(name, entity)
+			for key in self.index_keys[(name, entity['_id'])]:
+				self.index.setdefault(key, OrderedDict())[entity['_id']] = entity
+			should_flush = len(self.pending) >= self.batch_size or time.time() - self.last_flushed >= self.flush_interval
+
+		if should_flush:
+			self.flush()
@@ -18,7 +18,7 @@ setup(
 		'License :: OSI Approved :: MIT License',
 		'Natural Language :: English',
 		'Operating System :: OS Independent',
-		'Programming Language :: Python :: 3.4',
+		'Programming Language :: Python :: 3.5',
 		'Topic :: Scientific/Engineering :: Information Analysis'
 	],
 	keywords='predictive analytics horse racing',
@@ -35,7 +35,13 @@ setup(
 		'console_scripts': [
 			'scrape=predictivepunter.scrape:main',
 			'seed=predictivepunter.seed:main',
-			'predict=predictivepunter.predict:main'
+			'predict=predictivepunter.predict:main',
+			'serve=predictivepunter.service:main',
+			'pipeline=predictivepunter.pipeline:main',
+			'backtest=predictivepunter.backtest:main',
+			'live=predictivepunter.live:main',
+			'benchmark=predictivepunter.benchmark:main',
+			'restore=predictivepunter.backup:main'
 		]
 	},
 	install_requires=[